@@ -1,22 +1,22 @@
 """Ad Observatory API routes and methods specific to the API.
 """
+import collections
 import datetime
-import decimal
+import heapq
 import itertools
 from operator import itemgetter
 
 from flask import Blueprint, request, Response, abort, current_app
-import humanize
 import numpy as np
-import pandas as pd
-import simplejson as json
 
 import db_functions
-from common import date_utils, caching
+from common import date_utils, caching, json_utils
 
 URL_PREFIX = '/api/v1'
 
 blueprint = Blueprint('ad_observatory_api', __name__)
+# Also applies to child blueprints (ads search and google dashboard).
+blueprint.after_request(caching.make_response_conditional)
 
 OBSCURE_OBSERVATION_COUNT_AT_OR_BELOW = 5
 OBSCURE_OBSERVATION_COUNT_MESSAGE = '%s or less' % OBSCURE_OBSERVATION_COUNT_AT_OR_BELOW
@@ -44,6 +44,38 @@ def get_aggregate_by_request_arg(request_args):
         abort(400, description='Unknown aggregate_by arg {}'.format(aggregate_by))
     return aggregate_by
 
+@caching.global_cache.memoize(timeout=date_utils.SIX_HOURS_IN_SECONDS,
+                              args_to_ignore=['db_interface'])
+def get_topics(db_interface):
+    """Get dict of topic name -> topic ID. Memoized as topics rarely change."""
+    return db_interface.topics()
+
+@caching.global_cache.memoize(timeout=date_utils.SIX_HOURS_IN_SECONDS,
+                              args_to_ignore=['db_interface'])
+def get_topic_id_to_name_map(db_interface):
+    """Get dict of topic ID -> topic name. Memoized as topics rarely change."""
+    return db_interface.topic_id_to_name_map()
+
+@caching.global_cache.memoize(timeout=date_utils.ONE_HOUR_IN_SECONDS,
+                              args_to_ignore=['db_interface'])
+def get_page_name(db_interface, page_id, aggregate_by):
+    """Get name of page_id, or of the page owner of page_id if aggregating by page owner."""
+    if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
+        return db_interface.page_owner_page_name(page_id)
+    return db_interface.page_name(page_id)
+
+@caching.global_cache.memoize(timeout=date_utils.ONE_HOUR_IN_SECONDS,
+                              args_to_ignore=['db_interface'])
+def get_page_owner(db_interface, page_id):
+    """Get page owner of page_id. Memoized as page ownership rarely changes."""
+    return db_interface.page_owner(page_id)
+
+@caching.global_cache.memoize(timeout=date_utils.ONE_HOUR_IN_SECONDS,
+                              args_to_ignore=['db_interface'])
+def get_owned_pages(db_interface, page_id):
+    """Get list of page IDs owned by page_id. Memoized as page ownership rarely changes."""
+    return db_interface.owned_pages(page_id)
+
 def parse_time_span_arg(arg_str):
     """Parse request arg as a time span and provide number of days in it.
 
@@ -58,39 +90,36 @@ def parse_time_span_arg(arg_str):
 
     return arg_to_days.get(arg_str, 0)
 
-def get_active_days_in_range(
-        range_start, range_end, ad_delivery_start_time_series, last_active_date_series):
-    """Calculate the days an ad was active in a given range.
+def get_active_days_in_range(range_start, range_end, ad_delivery_start_time, last_active_date):
+    """Calculate the days an ad was active in a given range, or in each of several ranges.
 
     Args:
-        range_start: datetime.date Start of period of interest
-        range_end: datetime.date  End of period of interest
-        ad_delivery_start_time: pandas.Series[datetime.date] The date an ad started serving
-        last_active_date: pandas.Series[datetime.date] The date the ad was last active
+        range_start: datetime.date Start of period of interest, or sequence of period starts.
+        range_end: datetime.date  End of period of interest, or sequence of period ends.
+        ad_delivery_start_time: array-like[datetime.date] The date each ad started serving
+        last_active_date: array-like[datetime.date] The date each ad was last active
     Returns:
-        pandas.Series[int] of days ads were active in the range of interest
+        numpy.ndarray[int] of days ads were active in the range of interest. If range_start and
+        range_end are sequences the array has shape (number of ads, number of ranges). Ads whose
+        ad_delivery_start_time -> last_active_date range does not overlap with
+        range_start -> range_end have 0 days.
     """
-    def active_days_in_range(row):
-        """Get days active in range. If ad_delivery_start_time -> last_active_date range does not
-        overlap with range_start -> range_end, return 0.
-        """
-        ad_delivery_start_time = row['ad_delivery_start_time']
-        last_active_date = row['last_active_date']
-        if ad_delivery_start_time > range_end and last_active_date > range_end:
-            return 0
-        if ad_delivery_start_time < range_start and last_active_date < range_start:
-            return 0
-        min_date_in_range = min(max(ad_delivery_start_time, range_start), range_end)
-        max_date_in_range = min(max(last_active_date, range_start), range_end)
-        # add 1 to timedelta.days because we include both ad_delivery_start_time and last_active_day
-        return (max_date_in_range - min_date_in_range).days + 1
-
-    dates = pd.DataFrame(
-            {'ad_delivery_start_time': ad_delivery_start_time_series,
-             'last_active_date': last_active_date_series})
-
-    days_in_range = dates.apply(active_days_in_range, axis=1)
-    return days_in_range.replace([np.inf, -np.inf], 0).fillna(0)
+    range_start = np.asarray(range_start, dtype='datetime64[D]')
+    range_end = np.asarray(range_end, dtype='datetime64[D]')
+    ad_delivery_start_time = np.asarray(ad_delivery_start_time, dtype='datetime64[D]')
+    last_active_date = np.asarray(last_active_date, dtype='datetime64[D]')
+    if range_start.ndim:
+        # Broadcast ads against ranges to get an (ads x ranges) matrix.
+        ad_delivery_start_time = ad_delivery_start_time[:, np.newaxis]
+        last_active_date = last_active_date[:, np.newaxis]
+
+    min_date_in_range = np.minimum(np.maximum(ad_delivery_start_time, range_start), range_end)
+    max_date_in_range = np.minimum(np.maximum(last_active_date, range_start), range_end)
+    # add 1 to days because we include both ad_delivery_start_time and last_active_day
+    days_in_range = (max_date_in_range - min_date_in_range).astype(np.int64) + 1
+    not_in_range = ((ad_delivery_start_time > range_end) & (last_active_date > range_end)) | (
+        (ad_delivery_start_time < range_start) & (last_active_date < range_start))
+    return np.where(not_in_range, 0, np.maximum(days_in_range, 0))
 
 @blueprint.route('/total_spend/by_page/of_region/<region_name>')
 @caching.global_cache.cached(query_string=True,
@@ -107,13 +136,15 @@ def get_top_spenders_for_region(region_name):
 
         results = db_interface.get_spender_for_region(region_name, start_date, end_date,
                                                       aggregate_by)
-    response_data = json.dumps({'spenders': results.results,
+    if not results:
+        return Response(status=204, mimetype='application/json')
+    # Not streamed since cached responses must be materialized; the records are encoded in a single
+    # orjson call instead.
+    response_data = json_utils.dumps({'spenders': results.results,
                        'region_name': region_name,
-                       'start_date': results.start_date.isoformat(),
-                       'end_date': results.end_date.isoformat(),
+                       'start_date': results.start_date,
+                       'end_date': results.end_date,
                       })
-    if not response_data:
-        return Response(status=204, mimetype='application/json')
     return Response(response_data, mimetype='application/json')
 
 @blueprint.route('/total_spend/of_page/<int:page_id>/of_region/<region_name>')
@@ -131,10 +162,10 @@ def get_total_spending_by_spender_in_region_since_date(page_id, region_name):
 
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        page_owner = db_interface.page_owner(page_id)
+        page_owner = get_page_owner(db_interface, page_id)
         results = db_interface.page_spend_in_region_since_date(
             page_id, region_name, start_date, end_date, aggregate_by)
-        owned_pages = db_interface.owned_pages(page_id)
+        owned_pages = get_owned_pages(db_interface, page_id)
 
     if not results:
         return Response(status=204, mimetype='application/json')
@@ -142,9 +173,9 @@ def get_total_spending_by_spender_in_region_since_date(page_id, region_name):
     page_name = results.results[0]['page_name']
     # TODO(macpd): remove this once FE uses /pages/<int:page_id> to get owned page IDs
     results.results[0]['page_ids'] = owned_pages
-    response_data = json.dumps(
-        {'start_date': results.start_date.isoformat(),
-         'end_date': results.end_date.isoformat(),
+    response_data = json_utils.dumps(
+        {'start_date': results.start_date,
+         'end_date': results.end_date,
          'page_id': page_id,
          'page_owner': page_owner,
          'page_name': page_name,
@@ -183,32 +214,24 @@ def spending_by_week_by_spender_of_region(page_id, region_name, start_date, end_
             max_date=end_date, min_date=start_date, span_in_days=7)
         page_spend_by_week = db_interface.page_spend_in_region_by_week(
             page_id, region_name, weeks=weeks, aggregate_by=aggregate_by)
-        if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
-            page_name = db_interface.page_owner_page_name(page_id)
-        else:
-            page_name = db_interface.page_name(page_id)
-
-    if not page_spend_by_week:
-        return None
+        if not page_spend_by_week:
+            return None
+        page_name = get_page_name(db_interface, page_id, aggregate_by)
 
-    spend_by_week = []
-    disclaimers = set()
-    for row in page_spend_by_week:
-        spend_by_week.append(
-            {'week': row['report_date'].isoformat(), 'spend': row['spend']})
-        disclaimers.update(set(row['disclaimers']))
+    spend_by_week = [{'week': row['report_date'], 'spend': row['spend']}
+                     for row in page_spend_by_week]
+    disclaimers = set().union(*(row['disclaimers'] for row in page_spend_by_week))
 
     # Fill in missing time periods with spend of 0
-    all_weeks_isoformat = {week.isoformat() for week in weeks if week < datetime.date.today()}
-    weeks_with_spend = {row['week'] for row in spend_by_week}
-    weeks_without_spend = all_weeks_isoformat - weeks_with_spend
-    for week in weeks_without_spend:
-        spend_by_week.append({'week': week, 'spend': 0.0})
-    spend_by_week.sort(key=lambda x: x.get('week'))
-
-    return json.dumps(
+    today = datetime.date.today()
+    weeks_with_spend = {row['report_date'] for row in page_spend_by_week}
+    spend_by_week.extend({'week': week, 'spend': 0.0} for week in weeks
+                         if week < today and week not in weeks_with_spend)
+    spend_by_week.sort(key=itemgetter('week'))
+
+    return json_utils.dumps(
         {'time_unit': 'week',
-         'date_range': [min(weeks).isoformat(), max(weeks).isoformat()],
+         'date_range': [weeks[-1], weeks[0]],
          'page_id': page_id,
          'spend_by_week': spend_by_week,
          'region_name': region_name,
@@ -216,25 +239,40 @@ def spending_by_week_by_spender_of_region(page_id, region_name, start_date, end_
          'disclaimers': list(disclaimers)})
 
 def discount_spend_outside_daterange(start_date, end_date, ad_spend_records):
-    for ad_spend in ad_spend_records:
-        ad_delivery_start_time = ad_spend['ad_delivery_start_time']
-        last_active_date = ad_spend['last_active_date']
-        if ad_delivery_start_time >= start_date and last_active_date <= end_date:
-            # ad active only active within timerange of concern. No discounting required.
-            continue
+    """Discount spend of ads active outside of start_date -> end_date by the fraction of days the
+    ad was active within that range.
 
-        days_in_range = (
-            min(last_active_date, end_date) - max(start_date, ad_delivery_start_time)).days
-        days_ad_active = (last_active_date  - ad_delivery_start_time).days
-
-        if days_ad_active == 0:
-            days_ad_active = 1
-
-        if ad_spend['spend'] is None:
-            ad_spend['spend'] = 0
-        else:
-            ad_spend['spend'] = ad_spend['spend'] * days_in_range/days_ad_active
-    return ad_spend_records
+    Args:
+        start_date: datetime.date start of range of interest.
+        end_date: datetime.date end of range of interest.
+        ad_spend_records: sequence of dicts with spend, ad_delivery_start_time, and
+            last_active_date.
+    Returns:
+        list of float discounted spend of each record in ad_spend_records.
+    """
+    start_date = np.datetime64(start_date, 'D')
+    end_date = np.datetime64(end_date, 'D')
+    ad_delivery_start_time = np.array(
+        [row['ad_delivery_start_time'] for row in ad_spend_records], dtype='datetime64[D]')
+    last_active_date = np.array(
+        [row['last_active_date'] for row in ad_spend_records], dtype='datetime64[D]')
+    spend = np.nan_to_num(np.array([row['spend'] for row in ad_spend_records], dtype=float))
+
+    # ads only active within timerange of concern require no discounting.
+    active_only_in_range = (ad_delivery_start_time >= start_date) & (last_active_date <= end_date)
+    days_in_range = (
+        np.minimum(last_active_date, end_date) - np.maximum(start_date, ad_delivery_start_time)
+        ).astype(np.int64)
+    days_ad_active = (last_active_date - ad_delivery_start_time).astype(np.int64)
+    days_ad_active[days_ad_active == 0] = 1
+
+    return np.where(active_only_in_range, spend, spend * days_in_range / days_ad_active).tolist()
+
+def top_records_by_spend(records, max_records=None):
+    """Sort records by spend descending, keeping only the top max_records if provided."""
+    if max_records:
+        return heapq.nlargest(max_records, records, key=itemgetter('spend'))
+    return sorted(records, key=itemgetter('spend'), reverse=True)
 
 @blueprint.route('/total_spend/by_page/of_topic/<path:topic_name>/of_region/<region_name>')
 @caching.global_cache.cached(query_string=True,
@@ -258,7 +296,7 @@ def spenders_for_topic_in_region(topic_name, region_name, start_date, end_date,
                                  max_records=None):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        topics = db_interface.topics()
+        topics = get_topics(db_interface)
         topic_id = topics.get(topic_name, -1)
         if topic_id < 0:
             abort(404)
@@ -266,20 +304,19 @@ def spenders_for_topic_in_region(topic_name, region_name, start_date, end_date,
             region_name, start_date, end_date, topic_id, aggregate_by)
     if ad_spend_records is None:
         return None
-    discounted_spend_records = discount_spend_outside_daterange(start_date, end_date,
-                                                                ad_spend_records)
-    spend_data = pd.DataFrame.from_records(
-        discounted_spend_records, exclude=['last_active_date', 'ad_delivery_start_time'])
-    spend_data = spend_data.groupby('page_id', as_index=False).agg(
-        {'page_name':'min', 'spend':'sum'})
-    sorted_spend_data = spend_data.sort_values(by='spend', ascending=False)
-
-    if max_records:
-        sorted_spend_data = sorted_spend_data.head(max_records)
-    return json.dumps({
-        'spenders': sorted_spend_data.to_dict('records'),
-        'start_date': start_date.isoformat(),
-        'end_date': end_date.isoformat(),
+    discounted_spend = discount_spend_outside_daterange(start_date, end_date, ad_spend_records)
+    spend_by_page = {}
+    for row, spend in zip(ad_spend_records, discounted_spend):
+        # page_name is the same for every row of a page_id.
+        page_spend = spend_by_page.setdefault(
+            row['page_id'],
+            {'page_id': row['page_id'], 'page_name': row['page_name'], 'spend': 0.0})
+        page_spend['spend'] += spend
+
+    return json_utils.dumps({
+        'spenders': top_records_by_spend(spend_by_page.values(), max_records),
+        'start_date': start_date,
+        'end_date': end_date,
         'topic_name': topic_name,
         'region_name': region_name})
 
@@ -301,26 +338,22 @@ def get_top_topics_in_region(region_name):
 def top_topics_in_region(region_name, start_date, end_date, max_records=None):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        topic_map = db_interface.topic_id_to_name_map()
+        topic_map = get_topic_id_to_name_map(db_interface)
         ad_spend_records = db_interface.get_spend_for_topics_in_region(region_name, start_date,
                                                                        end_date)
     if not ad_spend_records:
         return None
-    discounted_spend_records = discount_spend_outside_daterange(start_date, end_date,
-                                                                ad_spend_records)
-    spend_data = pd.DataFrame.from_records(
-        discounted_spend_records, exclude=['last_active_date', 'ad_delivery_start_time'])
-    spend_data = spend_data.groupby('topic_id', as_index=False).agg({'spend':'sum'})
-    spend_data['topic_name'] = spend_data['topic_id'].map(topic_map)
-    spend_data = spend_data.drop(columns=['topic_id'])
-    sorted_spend_data = spend_data.sort_values(by='spend', ascending=False)
-
-    if max_records:
-        sorted_spend_data = sorted_spend_data.head(max_records)
-    return json.dumps({
-        'spend_by_topic': sorted_spend_data.to_dict('records'),
-        'start_date': start_date.isoformat(),
-        'end_date': end_date.isoformat(),
+    discounted_spend = discount_spend_outside_daterange(start_date, end_date, ad_spend_records)
+    spend_by_topic_id = collections.defaultdict(float)
+    for row, spend in zip(ad_spend_records, discounted_spend):
+        spend_by_topic_id[row['topic_id']] += spend
+    spend_by_topic = [{'spend': spend, 'topic_name': topic_map.get(topic_id)}
+                      for topic_id, spend in spend_by_topic_id.items()]
+
+    return json_utils.dumps({
+        'spend_by_topic': top_records_by_spend(spend_by_topic, max_records),
+        'start_date': start_date,
+        'end_date': end_date,
         'region_name': region_name})
 
 @blueprint.route('/spend_by_time_period/of_topic/<path:topic_name>/of_region/<region_name>')
@@ -345,7 +378,7 @@ def spend_by_week_for_topic(topic_name, region_name, start_date, end_date, time_
                                 time_period_length):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        topics = db_interface.topics()
+        topics = get_topics(db_interface)
         ad_spend_records = db_interface.total_spend_of_topic_in_region(
             region_name, start_date, end_date, topics[topic_name])
     if ad_spend_records is None:
@@ -354,90 +387,96 @@ def spend_by_week_for_topic(topic_name, region_name, start_date, end_date, time_
     periods = date_utils.generate_time_periods(
         max_date=end_date, min_date=start_date, span_in_days=time_period_length)
 
-    ad_spend_data = pd.DataFrame.from_records(ad_spend_records)
+    # Only the three columns used below are needed, so build them as arrays directly instead of
+    # going through a DataFrame.
+    ad_delivery_start_time = np.array(
+        [row['ad_delivery_start_time'] for row in ad_spend_records], dtype='datetime64[D]')
+    last_active_date = np.array(
+        [row['last_active_date'] for row in ad_spend_records], dtype='datetime64[D]')
+    spend_per_day = np.array([row['spend_per_day'] for row in ad_spend_records], dtype=float)
 
     # Clean up None values
-    ad_spend_data['last_active_date'] = ad_spend_data['last_active_date'].apply(
-        lambda x: x if x else datetime.date.today()+datetime.timedelta(days=1))
-
-    for i in range(len(periods)-1):
-        period_end_date = periods[i]
-        period_start_date = periods[i+1] + datetime.timedelta(days=1)
-        ad_spend_data[period_end_date] = (
-            ad_spend_data['spend_per_day'] * get_active_days_in_range(
-                period_start_date, period_end_date,
-                ad_spend_data['ad_delivery_start_time'],
-                ad_spend_data['last_active_date']))
-    ad_spend_data = ad_spend_data.drop(columns=[
-        'last_active_date',
-        'ad_delivery_start_time',
-        'spend_per_day',
-        'spend'])
-    spend_in_timeperiod = {}
-    for date, amount in ad_spend_data.sum(axis=0).to_dict().items():
-        spend_in_timeperiod[date.isoformat()] = int(amount)
+    last_active_date[np.isnat(last_active_date)] = (
+        datetime.date.today()+datetime.timedelta(days=1))
+
+    # Periods are in descending order, so each period ends on periods[i] and starts the day after
+    # periods[i+1].
+    period_end_dates = np.array(periods[:-1], dtype='datetime64[D]')
+    period_start_dates = np.array(periods[1:], dtype='datetime64[D]') + 1
+    active_days_in_periods = get_active_days_in_range(
+        period_start_dates, period_end_dates, ad_delivery_start_time, last_active_date)
+    spend_in_periods = np.nansum(spend_per_day[:, np.newaxis] * active_days_in_periods, axis=0)
+    spend_in_timeperiod = {
+        period_end_date: int(amount)
+        for period_end_date, amount in zip(periods[:-1], spend_in_periods)}
     result = {
         'spend_in_timeperiod': spend_in_timeperiod,
         'time_unit': time_period_unit,
-        'start_date': min(periods).isoformat(),
-        'end_date': max(periods).isoformat(),
+        'start_date': min(periods),
+        'end_date': max(periods),
         'topic_name': topic_name,
         'region_name': region_name,}
 
-    return json.dumps(result)
+    return json_utils.dumps(result)
 
 def assign_spend_to_timewindows(weeks_list, grouping_name, spend_query_result):
+    """Spread each row's spend evenly over its run days and sum it into 7 day windows per grouping.
+
+    Args:
+        weeks_list: list of datetime.date start dates of non-overlapping 7 day windows.
+        grouping_name: str key of spend_query_result rows to group spend by.
+        spend_query_result: iterable of rows with grouping_name, start_day, end_day, and spend.
+    Returns:
+        dict grouping -> list of {'time_period': week datetime.date, 'spend': spend} sorted by
+        time_period.
+    """
     result = {}
-    #setup week windows
-    day_to_week_window = {}
-    counter = 0
-    for week in weeks_list:
-        week_days = pd.date_range(start=week, periods=7)
-        for date in week_days:
-            day_to_week_window[date.date()] = counter
-
-        counter += 1
-
-
-    for row in spend_query_result:
-        grouping = row[grouping_name]
-        spend_start = row['start_day']
-        spend_end = row['end_day']
-        spend = 0
-        if row['spend']:
-            spend = row['spend']
-
-        run_days = spend_end - spend_start
-        run_days = max(run_days.days + 1, 1)
-
-        spend_per_day = decimal.Decimal(spend / run_days)
-        date_list = pd.date_range(start=spend_start, end=spend_end)
-        for spend_day in date_list:
-            if spend_day.date() in day_to_week_window:
-                spend_week = weeks_list[day_to_week_window[spend_day.date()]]
-                if grouping in result:
-                    week_found = False
-                    for tps in result[grouping]:
-                        if spend_week.isoformat() == tps['time_period']:
-                            tps['spend'] += spend_per_day
-                            week_found = True
-
-                    if not week_found:
-                        result[grouping].append(
-                            {'time_period':spend_week.isoformat(), 'spend':spend_per_day})
-
-                else:
-                    time_period_dict = {'time_period':spend_week.isoformat(),
-                                        'spend':spend_per_day}
-                    result[grouping] = [time_period_dict]
-
-    # Fill in time periods where spend is not present in query results. Exclude today's date since
-    # our pipeline does not yet include data collected today.
-    week_list_isoformat = {week.isoformat() for week in weeks_list if week < datetime.date.today()}
-    for grouping in result:
-        missing_weeks = week_list_isoformat - {row['time_period'] for row in result[grouping]}
-        result[grouping].extend([{'time_period': week, 'spend': 0} for week in missing_weeks])
-        result[grouping].sort(key=lambda x: x.get('time_period'))
+    spend_query_result = list(spend_query_result)
+    if not spend_query_result:
+        return result
+
+    grouping_to_id = {}
+    group_ids = np.array([grouping_to_id.setdefault(row[grouping_name], len(grouping_to_id))
+                          for row in spend_query_result])
+    groupings = list(grouping_to_id)
+    spend_start = np.array([row['start_day'] for row in spend_query_result],
+                           dtype='datetime64[D]')
+    spend_end = np.array([row['end_day'] for row in spend_query_result], dtype='datetime64[D]')
+    spend = np.array([row['spend'] or 0 for row in spend_query_result], dtype=float)
+    run_days = np.maximum((spend_end - spend_start).astype(np.int64) + 1, 1)
+    spend_per_day = spend / run_days
+
+    week_start = np.array(weeks_list, dtype='datetime64[D]')
+    week_end = week_start + 6
+    # (rows x weeks) matrix of the number of days each row was running in each window.
+    days_in_week = np.maximum(
+        (np.minimum(spend_end[:, np.newaxis], week_end) -
+         np.maximum(spend_start[:, np.newaxis], week_start)).astype(np.int64) + 1, 0)
+
+    # Sum rows into (groupings x weeks) matrices, in time and memory linear in the number of rows.
+    spend_by_grouping_and_week = np.zeros((len(groupings), len(weeks_list)))
+    np.add.at(spend_by_grouping_and_week, group_ids, spend_per_day[:, np.newaxis] * days_in_week)
+    days_by_grouping_and_week = np.zeros((len(groupings), len(weeks_list)), dtype=np.int64)
+    np.add.at(days_by_grouping_and_week, group_ids, days_in_week)
+
+    # Spend is in dollars, so round to cents and convert to python floats for serialization.
+    spend_by_grouping_and_week = spend_by_grouping_and_week.round(2).tolist()
+    has_days_by_grouping_and_week = (days_by_grouping_and_week > 0).tolist()
+    week_idxs_by_time_period = sorted(range(len(weeks_list)), key=weeks_list.__getitem__)
+    # Time periods where spend is not present in query results are filled in with 0. Exclude
+    # today's date since our pipeline does not yet include data collected today.
+    today = datetime.date.today()
+    is_before_today_by_idx = [week < today for week in weeks_list]
+    # Only groupings with spend on at least one day in weeks_list are included, in order of first
+    # appearance.
+    for group_id in dict.fromkeys(group_ids[days_in_week.any(axis=1)].tolist()):
+        group_spend = spend_by_grouping_and_week[group_id]
+        group_has_days = has_days_by_grouping_and_week[group_id]
+        result[groupings[group_id]] = [
+            {'time_period': weeks_list[week_idx],
+             'spend': group_spend[week_idx] if group_has_days[week_idx] else 0}
+            for week_idx in week_idxs_by_time_period
+            if group_has_days[week_idx] or is_before_today_by_idx[week_idx]]
     return result
 
 @blueprint.route('/spend_by_time_period/by_topic/of_page/<int:page_id>')
@@ -466,20 +505,17 @@ def spend_by_time_period_by_topic_of_page(page_id, start_date, end_date, aggrega
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         page_spend_over_time = db_interface.page_spend_by_topic_since_date(
             page_id, start_date, end_date, aggregate_by)
-        if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
-            page_name = db_interface.page_owner_page_name(page_id)
-        else:
-            page_name = db_interface.page_name(page_id)
-    if not page_spend_over_time:
-        return None
+        if not page_spend_over_time:
+            return None
+        page_name = get_page_name(db_interface, page_id, aggregate_by)
 
     weeks = date_utils.generate_time_periods(max_date=end_date, min_date=start_date, span_in_days=7)
 
     spend_by_time_period = assign_spend_to_timewindows(weeks, 'topic_name', page_spend_over_time)
 
-    return json.dumps(
+    return json_utils.dumps(
         {'time_unit': time_unit,
-         'date_range': [min(weeks).isoformat(), max(weeks).isoformat()],
+         'date_range': [weeks[-1], weeks[0]],
          'page_id': page_id,
          'page_name': page_name,
          'spend_by_time_period': spend_by_time_period})
@@ -513,13 +549,9 @@ def spend_by_time_period_by_topic_of_page_in_region(page_id, region_name, start_
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         page_spend_over_time = db_interface.spend_by_topic_of_page_in_region(
             page_id, region_name, start_date, end_date, aggregate_by)
-
-        if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
-            page_name = db_interface.page_owner_page_name(page_id)
-        else:
-            page_name = db_interface.page_name(page_id)
-    if not page_spend_over_time:
-        return None
+        if not page_spend_over_time:
+            return None
+        page_name = get_page_name(db_interface, page_id, aggregate_by)
 
     # Get max end_day from results.
     max_end_day = max(map(itemgetter('end_day'), page_spend_over_time))
@@ -530,9 +562,9 @@ def spend_by_time_period_by_topic_of_page_in_region(page_id, region_name, start_
 
     spend_by_time_period = assign_spend_to_timewindows(weeks, 'topic_name', page_spend_over_time)
 
-    return json.dumps(
+    return json_utils.dumps(
         {'time_unit': time_unit,
-         'date_range': [min(weeks).isoformat(), max(weeks).isoformat()],
+         'date_range': [weeks[-1], weeks[0]],
          'page_id': page_id,
          'page_name': page_name,
          'region_name': region_name,
@@ -575,9 +607,9 @@ def spend_by_time_period_by_topic_of_region(region_name, start_date, end_date):
 
     spend_by_time_period = assign_spend_to_timewindows(weeks, 'topic_name', region_spend_over_time)
 
-    return json.dumps(
+    return json_utils.dumps(
         {'time_unit': time_unit,
-         'date_range': [min(weeks).isoformat(), max(weeks).isoformat()],
+         'date_range': [weeks[-1], weeks[0]],
          'region_name': region_name,
          'spend_by_time_period': spend_by_time_period})
 
@@ -604,14 +636,13 @@ def total_spend_by_purpose_of_page(page_id, start_date, end_date, aggregate_by):
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         total_page_spend_by_type = db_interface.total_page_spend_by_type(page_id, start_date,
                                                                          end_date, aggregate_by)
-        if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
-            page_name = db_interface.page_owner_page_name(page_id)
-        else:
-            page_name = db_interface.page_name(page_id)
+        if not total_page_spend_by_type:
+            return None
+        page_name = get_page_name(db_interface, page_id, aggregate_by)
 
-    return json.dumps(
-        {'start_date': start_date.isoformat(),
-         'end_date': end_date.isoformat(),
+    return json_utils.dumps(
+        {'start_date': start_date,
+         'end_date': end_date,
          'page_id': page_id,
          'page_name': page_name,
          'spend_by_purpose': total_page_spend_by_type})
@@ -637,10 +668,12 @@ def total_spend_by_purpose_of_region(region_name, start_date, end_date):
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         total_spend_by_type_in_region = db_interface.total_spend_by_type_in_region(
             region_name, start_date, end_date)
+        if not total_spend_by_type_in_region:
+            return None
 
-    return json.dumps(
-        {'start_date': start_date.isoformat(),
-         'end_date': end_date.isoformat(),
+    return json_utils.dumps(
+        {'start_date': start_date,
+         'end_date': end_date,
          'region_name': region_name,
          'spend_by_purpose': total_spend_by_type_in_region})
 
@@ -668,11 +701,13 @@ def total_spend_by_purpose_of_page_of_region(page_id, region_name, start_date, e
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         total_page_spend_by_type = db_interface.total_spend_by_purpose_of_page_of_region(
                 page_id, region_name, start_date, end_date, aggregate_by)
-        page_name = db_interface.page_owner_page_name(page_id)
+        if not total_page_spend_by_type:
+            return None
+        page_name = get_page_name(db_interface, page_id, db_functions.AGGREGATE_BY_PAGE_OWNER)
 
-    return json.dumps(
-        {'start_date': start_date.isoformat(),
-         'end_date': end_date.isoformat(),
+    return json_utils.dumps(
+        {'start_date': start_date,
+         'end_date': end_date,
          'page_id': page_id,
          'page_name': page_name,
          'region_name': region_name,
@@ -707,20 +742,17 @@ def spend_by_time_period_by_purpose_of_page_in_region(page_id, region_name, star
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         page_spend_over_time = db_interface.spend_by_purpose_of_page_in_region(
             page_id, region_name, start_date, end_date, aggregate_by)
-        if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
-            page_name = db_interface.page_owner_page_name(page_id)
-        else:
-            page_name = db_interface.page_name(page_id)
-    if not page_spend_over_time:
-        return None
+        if not page_spend_over_time:
+            return None
+        page_name = get_page_name(db_interface, page_id, aggregate_by)
 
     weeks = date_utils.generate_time_periods(max_date=end_date, min_date=start_date, span_in_days=7)
 
     spend_by_time_period = assign_spend_to_timewindows(weeks, 'purpose', page_spend_over_time)
 
-    return json.dumps(
+    return json_utils.dumps(
         {'time_unit': time_unit,
-         'date_range': [min(weeks).isoformat(), max(weeks).isoformat()],
+         'date_range': [weeks[-1], weeks[0]],
          'page_id': page_id,
          'page_name': page_name,
          'region_name': region_name,
@@ -750,14 +782,11 @@ def total_spend_of_page_by_region(page_id, start_date, end_date, aggregate_by):
             page_id, start_date, end_date, aggregate_by)
         if not results:
             return None
-        if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
-            page_name = db_interface.page_owner_page_name(page_id)
-        else:
-            page_name = db_interface.page_name(page_id)
+        page_name = get_page_name(db_interface, page_id, aggregate_by)
 
-    return json.dumps(
-        {'start_date': results.start_date.isoformat(),
-         'end_date': results.end_date.isoformat(),
+    return json_utils.dumps(
+        {'start_date': results.start_date,
+         'end_date': results.end_date,
          'page_id': page_id,
          'page_name': page_name,
          'spend_by_region': results.results})
@@ -767,17 +796,18 @@ def obscure_too_low_count_or_convert_count_to_humanized_int(rows):
     """Obscures or converts "count" value in each row.
 
     Values <= OBSCURE_OBSERVATION_COUNT_AT_OR_BELOW are obscured with 'N or less', and other values
-    are converted to humanized int with commas (ie "N,NNN") or int in works (N million)."""
+    are converted to humanized int with commas (ie "N,NNN")."""
+    obscure_at_or_below = OBSCURE_OBSERVATION_COUNT_AT_OR_BELOW
+    obscured_count_message = OBSCURE_OBSERVATION_COUNT_MESSAGE
     for row in rows:
-        if 'count' in row:
-            count = row['count']
-            if count <= OBSCURE_OBSERVATION_COUNT_AT_OR_BELOW:
-                row['count'] = OBSCURE_OBSERVATION_COUNT_MESSAGE
-            else:
-                try:
-                    row['count'] = humanize.intcomma(count)
-                except OverflowError:
-                    row['count'] = humanize.intword(count)
+        count = row.get('count')
+        if count is None:
+            continue
+        if count <= obscure_at_or_below:
+            row['count'] = obscured_count_message
+        else:
+            # Same output as humanize.intcomma for ints, without its per call str/regex work.
+            row['count'] = f'{count:,}'
 
 
 @blueprint.route('/targeting/of_page/<int:page_id>')
@@ -802,30 +832,27 @@ def targeting_category_counts_for_page(page_id, start_date, end_date, aggregate_
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         targeting_category_count_records = db_interface.get_targeting_category_counts_for_page(
             page_id, start_date, end_date, aggregate_by)
-        if aggregate_by == db_functions.AGGREGATE_BY_PAGE_OWNER:
-            page_name = db_interface.page_owner_page_name(page_id)
-        else:
-            page_name = db_interface.page_name(page_id)
-    if targeting_category_count_records is None:
-        return None
+        if targeting_category_count_records is None:
+            return None
+        page_name = get_page_name(db_interface, page_id, aggregate_by)
     obscure_too_low_count_or_convert_count_to_humanized_int(targeting_category_count_records)
 
-    return json.dumps({
+    return json_utils.dumps({
         'targeting': targeting_category_count_records,
-        'start_date': start_date.isoformat(),
-        'end_date': end_date.isoformat(),
+        'start_date': start_date,
+        'end_date': end_date,
          'page_name': page_name,
         'page_id': page_id})
 
 @blueprint.route('/race_pages')
-@caching.global_cache.cached(query_string=True,
-                             response_filter=caching.cache_if_response_no_server_error,
-                             timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_response_blocking_duplicate_generation_of_cache_payload(
+    query_string=True, response_filter=caching.cache_if_response_no_server_error,
+    timeout=date_utils.SIX_HOURS_IN_SECONDS)
 def race_pages():
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        data = {row['race_id']: row['page_ids'] for row in db_interface.race_pages()}
-    return Response(json.dumps(data), mimetype='application/json')
+        data = db_interface.race_pages()
+    return Response(json_utils.dumps(data), mimetype='application/json')
 
 @blueprint.route('/race/<race_id>/candidates')
 @caching.global_cache.cached(query_string=True,
@@ -844,33 +871,37 @@ def candidates_in_race(race_id):
         candidates_info = db_interface.candidates_in_race(race_id)
         if not candidates_info:
             return None
-        for row in candidates_info:
-            pages_info = db_interface.owned_page_info(row['page_owner'])
-            if pages_info:
-                # TODO(macpd): add open secrets ID
-                data['candidates'].append({'pages': pages_info, 'short_name': row['short_name'],
-                                           'full_name': row['full_name'], 'party': row['party']})
-    return json.dumps(data)
+        owned_page_info = db_interface.owned_page_info_of_page_owners(
+            [row['page_owner'] for row in candidates_info])
+    for row in candidates_info:
+        pages_info = owned_page_info.get(row['page_owner'])
+        if pages_info:
+            # TODO(macpd): add open secrets ID
+            data['candidates'].append({'pages': pages_info, 'short_name': row['short_name'],
+                                       'full_name': row['full_name'], 'party': row['party']})
+    return json_utils.dumps(data)
 
 
 @blueprint.route('/races')
-@caching.global_cache.cached(query_string=True,
-                             response_filter=caching.cache_if_response_no_server_error,
-                             timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_response_blocking_duplicate_generation_of_cache_payload(
+    query_string=True, response_filter=caching.cache_if_response_no_server_error,
+    timeout=date_utils.SIX_HOURS_IN_SECONDS)
 def get_races():
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        data = json.dumps({row['state']: list(filter(None, row['races']))
-                           for row in db_interface.state_races()})
+        data = json_utils.dumps({state: [race for race in races if race]
+                                 for state, races in db_interface.state_races().items()})
     return Response(data, mimetype='application/json')
 
 @blueprint.route('/missed_ads')
-@caching.global_cache.cached(query_string=True,
-                             response_filter=caching.cache_if_response_no_server_error,
-                             timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_response_blocking_duplicate_generation_of_cache_payload(
+    query_string=True, response_filter=caching.cache_if_response_no_server_error,
+    timeout=date_utils.SIX_HOURS_IN_SECONDS)
 def get_missed_ads():
     country = request.args.get('country', 'US')
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        data = json.dumps(list(db_interface.missed_ads(country)))
-    return Response(data, mimetype='application/json')
+        missed_ads = db_interface.missed_ads(country)
+    # missed_ads is already a list, so serialize it directly (without copying) after
+    # the DB connection is returned to the pool.
+    return Response(json_utils.dumps(missed_ads), mimetype='application/json')
@@ -1,25 +1,43 @@
 """Routes and logic for ad search """
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 import datetime
-import io
 import logging
 from operator import itemgetter
+import os
+import tempfile
+import threading
 import time
 
 import dhash
 from flask import Blueprint, request, Response, abort, current_app
 import humanize
+import numpy as np
 from PIL import Image
-import pybktree
 import pycountry
-import simplejson as json
 
 import db_functions
-from common import elastic_search, date_utils, caching, ad_filtering_utils
+from common import elastic_search, date_utils, caching, ad_filtering_utils, json_utils
 
 blueprint = Blueprint('ads_search', __name__)
-
-ArchiveIDAndSimHash = namedtuple('ArchiveIDAndSimHash', ['archive_id', 'sim_hash'])
+dhash.force_pil()
+
+# Parallel arrays of image simhashes (one row of big-endian bytes per simhash, sorted by first byte)
+# and the lowest archive_id with that simhash, plus first_byte_offsets where
+# sim_hashes[first_byte_offsets[b]:first_byte_offsets[b + 1]] are the simhashes with first byte b.
+ImageSimHashIndex = namedtuple('ImageSimHashIndex',
+                               ['sim_hashes', 'first_byte_offsets', 'archive_ids'])
+# dhash.dhash_int default size 8 produces 8 * 8 row hash bits + 8 * 8 column hash bits.
+SIM_HASH_NUM_BYTES = 8 * 8 * 2 // 8
+# Number of bits set in each possible byte value, used to count bit differences between simhashes.
+BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+ALL_BYTE_VALUES = np.arange(256, dtype=np.uint8)
+# Directory where the simhash index arrays are saved, so that they can be memory mapped (and shared
+# through the OS page cache) by all workers instead of each rebuilding them from the DB.
+IMAGE_SIMHASH_INDEX_DIR = os.environ.get('IMAGE_SIMHASH_INDEX_DIR', tempfile.gettempdir())
+IMAGE_SIMHASH_INDEX_MAX_AGE_SECONDS = date_utils.SIX_HOURS_IN_SECONDS
+_image_simhash_index = None
+_image_simhash_index_built_at = 0
+_image_simhash_index_lock = threading.Lock()
 
 ALLOWED_ORDER_BY_FIELDS_CLUSTER_SEARCH = set(['min_ad_delivery_start_time', 'max_last_active_date',
                                               'min_ad_creation_time', 'max_ad_creation_time',
@@ -51,35 +69,55 @@ LANGUAGE_CODE_TO_NAME_OVERRIDE_MAP = {
     'zh-cn': 'Chinese (Simplified)',
     'zh-tw': 'Chinese (Traditional)'
 }
+# Built once at import, as pycountry lookups load and scan its language database.
+LANGUAGE_CODE_TO_NAME = {
+    language.alpha_2: language.name for language in pycountry.languages
+    if hasattr(language, 'alpha_2')}
+LANGUAGE_CODE_TO_NAME.update(LANGUAGE_CODE_TO_NAME_OVERRIDE_MAP)
+HUMANIZE_INT_POWERS_AND_WORDS = (
+    (10 ** 6, 'million'), (10 ** 9, 'billion'), (10 ** 12, 'trillion'))
 NUM_REQUESTED_ALL = 'ALL'
 MAX_AD_SEARCH_QUERY_LIMIT = 1000
 MAX_ELASTIC_SEARCH_RESULTS = 10 * MAX_AD_SEARCH_QUERY_LIMIT
+# Filter options loaded from static files, serialized once as JSON object members (ie without the
+# enclosing braces) for splicing into /filter-options responses.
+STATIC_FILTER_OPTIONS_JSON_MEMBERS = json_utils.dumps({
+    'regions': ad_filtering_utils.REGION_FILTERS_DATA,
+    'genders': ad_filtering_utils.GENDER_FILTERS_DATA,
+    'ageRanges': ad_filtering_utils.AGE_RANGE_FILTERS_DATA,
+    'orderByOptions': ad_filtering_utils.ORDER_BY_FILTERS_DATA,
+    'orderDirections': ad_filtering_utils.ORDER_DIRECTION_FILTERS_DATA})[1:-1]
 
 
 def get_image_dhash_as_int(image_file_stream):
-    image_file = io.BytesIO(image_file_stream.read())
-    image = Image.open(image_file)
-    dhash.force_pil()
+    # PIL reads the (seekable) upload stream directly; dhash converts to grayscale and resizes
+    # itself, which must stay as is so hashes match those of indexed ad creatives.
+    image = Image.open(image_file_stream)
     return dhash.dhash_int(image)
 
 def humanize_int(i):
     """Format numbers for easier readability. Numbers over 1 million are comma formatted, numbers
     over 1 million will be formatted like "1.2 million"
 
+    Output is the same as humanize.intcomma/intword, but formatted directly since this is called
+    several times for every row of search results.
+
     Args:
         i: int to format.
     Returns:
         string of formatted number.
     """
     if i < 1000000:
-        return humanize.intcomma(i)
+        return f'{i:,}'
+    for power, word in HUMANIZE_INT_POWERS_AND_WORDS:
+        # Like humanize.intword, move on to the next larger word if this one would round to 1000.0
+        # (ie i >= 999.95 * power).
+        if i * 20 < 19999 * power:
+            return f'{i / power:.1f} {word}'
     return humanize.intword(i)
 
-def get_cluster_languages_code_to_name():
-    with db_functions.get_fb_ads_database_connection() as db_connection:
-        db_interface = db_functions.FBAdsDBInterface(db_connection)
-        language_code_list = db_interface.cluster_languages()
-    return make_language_code_to_name_map(language_code_list)
+def get_cluster_languages_code_to_name(db_interface):
+    return make_language_code_to_name_map(db_interface.cluster_languages())
 
 def get_languages_code_to_name():
     with db_functions.get_fb_ads_database_connection() as db_connection:
@@ -87,24 +125,13 @@ def get_languages_code_to_name():
         language_code_list = db_interface.ad_creative_languages()
     return make_language_code_to_name_map(language_code_list)
 
-@caching.global_cache.memoize()
 def make_language_code_to_name_map(language_code_list):
-    language_code_to_name = {}
-    for language_code in language_code_list:
-        if language_code in LANGUAGE_CODE_TO_NAME_OVERRIDE_MAP:
-            language_code_to_name[language_code] = LANGUAGE_CODE_TO_NAME_OVERRIDE_MAP[language_code]
-        else:
-            try:
-                language_code_to_name[language_code] = pycountry.languages.get(
-                    alpha_2=language_code).name
-            except AttributeError as err:
-                logging.info('Unable to get langauge name for language code %s. error: %s',
-                             language_code, err)
-                language_code_to_name[language_code] = language_code
-    return language_code_to_name
-
-def get_language_filter_options():
-    language_code_to_name = get_cluster_languages_code_to_name()
+    # Language codes without a known name are mapped to themselves.
+    return {language_code: LANGUAGE_CODE_TO_NAME.get(language_code, language_code)
+            for language_code in language_code_list}
+
+def get_language_filter_options(db_interface):
+    language_code_to_name = get_cluster_languages_code_to_name(db_interface)
     language_filter_data = [{'label': 'All', 'value': 'all'}]
     # Add languages sorted by langauge name.
     for key, val in sorted(language_code_to_name.items(), key=itemgetter(1)):
@@ -118,15 +145,17 @@ def get_language_filter_options():
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
 def get_filter_options():
     """Options for filtering. Used by FE to populate filter selectors."""
+    topics_filter_data = ad_filtering_utils.topics_filter_data()
+    with db_functions.get_fb_ads_database_connection() as db_connection:
+        db_interface = db_functions.FBAdsDBInterface(db_connection)
+        language_filter_data = get_language_filter_options(db_interface)
+    # Only topics and languages are serialized per request; the static options are spliced in
+    # from their pre-serialized JSON object members.
     return Response(
-        json.dumps({
-            'topics': ad_filtering_utils.topics_filter_data(),
-            'regions': ad_filtering_utils.REGION_FILTERS_DATA,
-            'genders': ad_filtering_utils.GENDER_FILTERS_DATA,
-            'ageRanges': ad_filtering_utils.AGE_RANGE_FILTERS_DATA,
-            'orderByOptions': ad_filtering_utils.ORDER_BY_FILTERS_DATA,
-            'orderDirections': ad_filtering_utils.ORDER_DIRECTION_FILTERS_DATA,
-            'languages': get_language_filter_options()}),
+        b''.join([b'{"topics":', json_utils.dumps(topics_filter_data),
+                  b',', STATIC_FILTER_OPTIONS_JSON_MEMBERS,
+                  b',"languages":', json_utils.dumps(language_filter_data),
+                  b'}']),
         mimetype='application/json')
 
 @blueprint.route('/topics')
@@ -134,68 +163,84 @@ def get_filter_options():
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
 def topic_names():
-    return Response(json.dumps(ad_filtering_utils.topic_names()), mimetype='application/json')
-
-def get_ad_cluster_record(ad_cluster_data_row):
-    ad_cluster_data = {}
-    ad_cluster_data['ad_cluster_id'] = ad_cluster_data_row['ad_cluster_id']
-    ad_cluster_data['canonical_archive_id'] = ad_cluster_data_row['canonical_archive_id']
-    ad_cluster_data['archive_ids'] = ad_cluster_data_row['archive_ids']
-    # Ad start/end dates are used for display only, never used for computation
-    ad_cluster_data['start_date'] = ad_cluster_data_row['min_ad_delivery_start_time'].isoformat()
-    ad_cluster_data['end_date'] = ad_cluster_data_row['max_last_active_date'].isoformat()
-
-    # This is the total spend and impression for the ad across all demos/regions
-    # Again, used for display and not computation
-    # TODO(macpd): use correct currency symbol instead of assuming USD.
+    return Response(json_utils.dumps(ad_filtering_utils.topic_names()),
+                    mimetype='application/json')
+
+def get_ad_cluster_record(ad_cluster_data_row, screenshot_url_prefix):
+    # Built as a single dict literal with row values bound to locals, since this runs for every row
+    # of search results (up to MAX_AD_SEARCH_QUERY_LIMIT).
+    canonical_archive_id = ad_cluster_data_row['canonical_archive_id']
     min_spend_sum = ad_cluster_data_row['min_spend_sum']
     max_spend_sum = ad_cluster_data_row['max_spend_sum']
-    ad_cluster_data['min_spend_sum'] = min_spend_sum
-    ad_cluster_data['max_spend_sum'] = max_spend_sum
-    ad_cluster_data['total_spend'] = '$%s - $%s' % (
-        humanize_int(int(min_spend_sum)), humanize_int(int(max_spend_sum)))
-
     min_impressions_sum = ad_cluster_data_row['min_impressions_sum']
     max_impressions_sum = ad_cluster_data_row['max_impressions_sum']
-    ad_cluster_data['min_impressions_sum'] = min_impressions_sum
-    ad_cluster_data['max_impressions_sum'] = max_impressions_sum
-    ad_cluster_data['total_impressions'] = '%s - %s' % (
-        humanize_int(int(min_impressions_sum)), humanize_int(int(max_impressions_sum)))
-
-    ad_cluster_data['url'] = ad_filtering_utils.make_ad_screenshot_url(ad_cluster_data_row['canonical_archive_id'])
-    ad_cluster_data['cluster_size'] = humanize_int(int(ad_cluster_data_row['cluster_size']))
-    ad_cluster_data['num_pages'] = humanize_int(int(ad_cluster_data_row['num_pages']))
-    ad_cluster_data['currencies'] = ad_cluster_data_row['currencies']
-
-    return ad_cluster_data
-
-def get_ad_record(ad_data_row):
-    ad_data = {}
-    ad_data['archive_id'] = ad_data_row['archive_id']
-    # Ad start/end dates are used for display only, never used for computation
-    ad_data['start_date'] = ad_data_row['ad_delivery_start_time'].isoformat()
-    ad_data['end_date'] = ad_data_row['last_active_date'].isoformat()
-
-    # This is the total spend and impression for the ad across all demos/regions
-    # Again, used for display and not computation
-    ad_data['currency'] = ad_data_row['currency']
+    return {
+        'ad_cluster_id': ad_cluster_data_row['ad_cluster_id'],
+        'canonical_archive_id': canonical_archive_id,
+        'archive_ids': ad_cluster_data_row['archive_ids'],
+        # Ad start/end dates are used for display only, never used for computation. Serialized in
+        # ISO format by json_utils.
+        'start_date': ad_cluster_data_row['min_ad_delivery_start_time'],
+        'end_date': ad_cluster_data_row['max_last_active_date'],
+        # This is the total spend and impression for the ad across all demos/regions
+        # Again, used for display and not computation
+        # TODO(macpd): use correct currency symbol instead of assuming USD.
+        'min_spend_sum': min_spend_sum,
+        'max_spend_sum': max_spend_sum,
+        'total_spend': '$%s - $%s' % (
+            humanize_int(int(min_spend_sum)), humanize_int(int(max_spend_sum))),
+        'min_impressions_sum': min_impressions_sum,
+        'max_impressions_sum': max_impressions_sum,
+        'total_impressions': '%s - %s' % (
+            humanize_int(int(min_impressions_sum)), humanize_int(int(max_impressions_sum))),
+        'url': ad_filtering_utils.make_ad_screenshot_url(canonical_archive_id,
+                                                         screenshot_url_prefix),
+        'cluster_size': humanize_int(int(ad_cluster_data_row['cluster_size'])),
+        'num_pages': humanize_int(int(ad_cluster_data_row['num_pages'])),
+        'currencies': ad_cluster_data_row['currencies']}
+
+def get_ad_record(ad_data_row, screenshot_url_prefix):
+    # Built as a single dict literal with row values bound to locals, since this runs for every row
+    # of search results (up to MAX_AD_SEARCH_QUERY_LIMIT).
+    archive_id = ad_data_row['archive_id']
+    currency = ad_data_row['currency']
     min_spend = ad_data_row['min_spend']
     max_spend = ad_data_row['max_spend']
-    ad_data['min_spend'] = min_spend
-    ad_data['max_spend'] = max_spend
-    ad_data['total_spend'] = '%s - %s %s' % (
-        humanize_int(int(min_spend)), humanize_int(int(max_spend)), ad_data['currency'])
-
     min_impressions = ad_data_row['min_impressions']
     max_impressions = ad_data_row['max_impressions']
-    ad_data['min_impressions'] = min_impressions
-    ad_data['max_impressions'] = max_impressions
-    ad_data['total_impressions'] = '%s - %s' % (
-        humanize_int(int(min_impressions)), humanize_int(int(max_impressions)))
-
-    ad_data['url'] = ad_filtering_utils.make_ad_screenshot_url(ad_data['archive_id'])
+    return {
+        'archive_id': archive_id,
+        # Ad start/end dates are used for display only, never used for computation. Serialized in
+        # ISO format by json_utils.
+        'start_date': ad_data_row['ad_delivery_start_time'],
+        'end_date': ad_data_row['last_active_date'],
+        # This is the total spend and impression for the ad across all demos/regions
+        # Again, used for display and not computation
+        'currency': currency,
+        'min_spend': min_spend,
+        'max_spend': max_spend,
+        'total_spend': '%s - %s %s' % (
+            humanize_int(int(min_spend)), humanize_int(int(max_spend)), currency),
+        'min_impressions': min_impressions,
+        'max_impressions': max_impressions,
+        'total_impressions': '%s - %s' % (
+            humanize_int(int(min_impressions)), humanize_int(int(max_impressions))),
+        'url': ad_filtering_utils.make_ad_screenshot_url(archive_id, screenshot_url_prefix)}
+
+def parse_zulu_time_or_date_arg(arg_str):
+    """Parse request arg that is either a UTC datetime in Zulu time (ie 2020-06-23T04:00:00.000Z),
+    which is dropped to just the date, or a date accepted by date_utils.parse_date_arg.
 
-    return ad_data
+    Returns:
+        datetime.date, or None if arg cannot be parsed.
+    """
+    # Slicing out the date of Zulu time is much faster than strptime of the full format.
+    if len(arg_str) > 10 and arg_str[10] == 'T' and arg_str[-1] == 'Z':
+        try:
+            return datetime.date.fromisoformat(arg_str[:10])
+        except ValueError:
+            pass
+    return date_utils.parse_date_arg(arg_str)
 
 def get_cluster_search_allowed_order_by_and_direction(order_by, direction):
     """Get |order_by| and |direction| which are valid and safe to send to FBAdsDBInterface for
@@ -226,10 +271,10 @@ def get_ad_search_allowed_order_by_and_direction(order_by, direction):
 
     return None, None
 
-@caching.global_cache.memoize(timeout=date_utils.ONE_DAY_IN_SECONDS)
+@caching.memoize_by_args_digest(timeout=date_utils.ONE_DAY_IN_SECONDS)
 def get_ad_cluster_data_from_full_text_search(query, page_id, min_date, max_date, region, gender,
                                               age_group, language, order_by, order_direction,
-                                              limit):
+                                              limit, offset):
     es_api_params = current_app.config['FB_ADS_ELASTIC_SEARCH_API_PARAMS']
     query_results = elastic_search.query_elastic_search_fb_ad_creatives_index(
         elastic_search_api_params=es_api_params,
@@ -251,21 +296,22 @@ def get_ad_cluster_data_from_full_text_search(query, page_id, min_date, max_date
         return db_interface.ad_cluster_details_for_archive_ids(archive_ids, min_date, max_date,
                                                                region, gender, age_group, language,
                                                                order_by, order_direction,
-                                                               limit=limit)
+                                                               limit=limit, offset=offset)
 
-@caching.global_cache.memoize(timeout=date_utils.ONE_DAY_IN_SECONDS)
+@caching.memoize_by_args_digest(timeout=date_utils.ONE_DAY_IN_SECONDS)
 def get_ad_cluster_data_for_page_id(page_id, min_date, max_date, region, gender, age_group,
-                                    language, topic_id, order_by, order_direction, limit):
+                                    language, topic_id, order_by, order_direction, limit,
+                                    offset):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         return db_interface.ad_cluster_details_for_page_id(
             page_id, min_date=min_date, max_date=max_date, region=region, gender=gender,
             age_group=age_group, language=language, topic_id=topic_id, order_by=order_by,
-            order_direction=order_direction, limit=limit)
+            order_direction=order_direction, limit=limit, offset=offset)
 
-@caching.global_cache.memoize(timeout=date_utils.ONE_DAY_IN_SECONDS)
+@caching.memoize_by_args_digest(timeout=date_utils.ONE_DAY_IN_SECONDS)
 def get_ad_data_from_full_text_search(query, page_id, min_date, max_date, region, gender, age_group,
-                                      language, order_by, order_direction, limit):
+                                      language, order_by, order_direction, limit, offset):
     es_api_params = current_app.config['FB_ADS_ELASTIC_SEARCH_API_PARAMS']
     query_results = elastic_search.query_elastic_search_fb_ad_creatives_index(
         elastic_search_api_params=es_api_params,
@@ -286,163 +332,264 @@ def get_ad_data_from_full_text_search(query, page_id, min_date, max_date, region
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         return db_interface.ad_details_of_archive_ids(archive_ids, min_date, max_date, region,
                                                       gender, age_group, language, order_by,
-                                                      order_direction, limit=limit)
+                                                      order_direction, limit=limit,
+                                                      offset=offset)
 
-@caching.global_cache.memoize(timeout=date_utils.ONE_DAY_IN_SECONDS)
+@caching.memoize_by_args_digest(timeout=date_utils.ONE_DAY_IN_SECONDS)
 def get_ad_data_for_page_id(page_id, min_date, max_date, region, gender, age_group, language,
-                            topic_id, order_by, order_direction, limit):
+                            topic_id, order_by, order_direction, limit, offset):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         return db_interface.ad_details_of_page_id(
             page_id, min_date=min_date, max_date=max_date, region=region, gender=gender,
             age_group=age_group, language=language, topic_id=topic_id, order_by=order_by,
-            order_direction=order_direction, limit=limit)
+            order_direction=order_direction, limit=limit, offset=offset)
 
-@caching.global_cache.memoize(timeout=date_utils.ONE_DAY_IN_SECONDS)
+@caching.memoize_by_args_digest(timeout=date_utils.ONE_DAY_IN_SECONDS)
 def get_ad_cluster_data_for_topic(
             topic_id, min_date, max_date, region, gender,
             age_group, language, order_by,
-            order_direction, limit,
+            order_direction, limit, offset,
             min_topic_percentage_threshold):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         return db_interface.topic_top_ad_clusters_by_spend(
             topic_id, min_date=min_date, max_date=max_date, region=region, gender=gender,
             age_group=age_group, language=language, order_by=order_by,
-            order_direction=order_direction, limit=limit,
+            order_direction=order_direction, limit=limit, offset=offset,
             min_topic_percentage_threshold=min_topic_percentage_threshold)
 
-@caching.global_cache.memoize(timeout=date_utils.ONE_DAY_IN_SECONDS)
+@caching.memoize_by_args_digest(timeout=date_utils.ONE_DAY_IN_SECONDS)
 def get_ad_data_for_topic(topic_id, min_date, max_date, region, gender, age_group, language,
-                          order_by, order_direction, limit):
+                          order_by, order_direction, limit, offset):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         return db_interface.ad_details_of_topic(
             topic_id, min_date=min_date, max_date=max_date, region=region, gender=gender,
             age_group=age_group, language=language, order_by=order_by,
-            order_direction=order_direction, limit=limit)
+            order_direction=order_direction, limit=limit, offset=offset)
+
+def sim_hash_to_bytes(sim_hash):
+    return sim_hash.to_bytes(SIM_HASH_NUM_BYTES, 'big')
+
+def image_simhash_index_file_paths():
+    return ImageSimHashIndex(
+        sim_hashes=os.path.join(IMAGE_SIMHASH_INDEX_DIR, 'image_simhash_index_sim_hashes.npy'),
+        first_byte_offsets=os.path.join(IMAGE_SIMHASH_INDEX_DIR,
+                                        'image_simhash_index_first_byte_offsets.npy'),
+        archive_ids=os.path.join(IMAGE_SIMHASH_INDEX_DIR, 'image_simhash_index_archive_ids.npy'))
+
+def save_image_simhash_index(index):
+    """Save index arrays to IMAGE_SIMHASH_INDEX_DIR. Each file is written to a temp file and then
+    renamed, so concurrent readers never see partially written arrays."""
+    for array, path in zip(index, image_simhash_index_file_paths()):
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+
+def load_image_simhash_index():
+    """Memory map saved index arrays.
 
-def get_num_bits_different(archive_id_and_simhash1, archive_id_and_simhash2):
-    return dhash.get_num_bits_different(archive_id_and_simhash1.sim_hash,
-                                        archive_id_and_simhash2.sim_hash)
+    Returns:
+        (ImageSimHashIndex, time index was saved) or (None, None) if there is no saved index.
+    """
+    paths = image_simhash_index_file_paths()
+    try:
+        # Archive IDs are saved last, so their mtime is when the whole index was saved.
+        saved_at = os.path.getmtime(paths.archive_ids)
+        index = ImageSimHashIndex(
+            sim_hashes=np.load(paths.sim_hashes, mmap_mode='r'),
+            first_byte_offsets=np.load(paths.first_byte_offsets, mmap_mode='r'),
+            archive_ids=np.load(paths.archive_ids, mmap_mode='r'))
+        # Arrays from different saves if loaded while another worker was saving.
+        if not (len(index.sim_hashes) == len(index.archive_ids) == index.first_byte_offsets[-1]):
+            raise ValueError('sim_hashes, first_byte_offsets and archive_ids lengths differ')
+        return index, saved_at
+    except (OSError, ValueError) as error:
+        logging.info('Unable to load saved image simhash index: %s', error)
+        return None, None
 
-@caching.global_cache.memoize(timeout=date_utils.SIX_HOURS_IN_SECONDS)
-def get_image_simhash_bktree():
+def image_simhash_index_is_fresh(built_at):
+    return time.time() - built_at <= IMAGE_SIMHASH_INDEX_MAX_AGE_SECONDS
+
+def get_image_simhash_index():
+    """Get image simhash index, from memory if built less than IMAGE_SIMHASH_INDEX_MAX_AGE_SECONDS
+    ago, else from saved arrays if they are fresh, else built from the DB (and saved)."""
+    global _image_simhash_index, _image_simhash_index_built_at
+    with _image_simhash_index_lock:
+        if (_image_simhash_index is not None and
+                image_simhash_index_is_fresh(_image_simhash_index_built_at)):
+            return _image_simhash_index
+
+        index, built_at = load_image_simhash_index()
+        if index is None or not image_simhash_index_is_fresh(built_at):
+            index = build_image_simhash_index()
+            built_at = time.time()
+            try:
+                save_image_simhash_index(index)
+            except OSError as error:
+                logging.warning('Unable to save image simhash index: %s', error)
+        _image_simhash_index = index
+        _image_simhash_index_built_at = built_at
+        return index
+
+def build_image_simhash_index():
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
-        simhash_to_archive_id_set = db_interface.all_ad_creative_image_simhashes()
+        simhash_to_archive_id = db_interface.all_ad_creative_image_simhashes()
+    return make_image_simhash_index(simhash_to_archive_id)
 
-    total_sim_hashes = len(simhash_to_archive_id_set)
+def make_image_simhash_index(simhash_to_archive_id):
+    """Make ImageSimHashIndex from dict of int simhash -> archive_id."""
+    total_sim_hashes = len(simhash_to_archive_id)
     logging.info('Got %d image simhashes to process.', total_sim_hashes)
 
-    # Create BKTree with dhash bit difference function as distance_function, used to find similar
-    # hashes
-    image_simhash_tree = pybktree.BKTree(get_num_bits_different)
-
-    sim_hashes_added_to_tree = 0
-    tree_construction_start_time = time.time()
-    for sim_hash, archive_id_set in simhash_to_archive_id_set.items():
-        # Add single entry in BK tree for simhash with lowest archive_id.
-        image_simhash_tree.add(ArchiveIDAndSimHash(sim_hash=sim_hash,
-                                                   archive_id=min(archive_id_set)))
-        sim_hashes_added_to_tree += 1
-        if sim_hashes_added_to_tree % 1000 == 0:
-            logging.debug('Added %d/%d simhashes to BKtree.', sim_hashes_added_to_tree,
-                          total_sim_hashes)
-    logging.info('Constructed BKTree in %s seconds', (time.time() - tree_construction_start_time))
-    return image_simhash_tree
-
+    index_construction_start_time = time.time()
+    sim_hashes = np.frombuffer(
+        b''.join(map(sim_hash_to_bytes, simhash_to_archive_id.keys())),
+        dtype=np.uint8).reshape(total_sim_hashes, SIM_HASH_NUM_BYTES)
+    archive_ids = np.fromiter(simhash_to_archive_id.values(), dtype=np.int64,
+                              count=total_sim_hashes)
+    # Group simhashes by first byte so searches can skip groups that are too different.
+    order = np.argsort(sim_hashes[:, 0], kind='stable')
+    sim_hashes = sim_hashes[order]
+    archive_ids = archive_ids[order]
+    first_byte_offsets = np.searchsorted(sim_hashes[:, 0], np.arange(257))
+    logging.info('Constructed simhash index in %s seconds',
+                 (time.time() - index_construction_start_time))
+    return ImageSimHashIndex(sim_hashes=sim_hashes, first_byte_offsets=first_byte_offsets,
+                             archive_ids=archive_ids)
+
+def find_similar_image_archive_ids(image_dhash, bit_difference_threshold):
+    """Get archive IDs of images with simhash at most bit_difference_threshold bits different from
+    image_dhash.
+
+    At the thresholds used for reverse image search (up to half the hash bits) a BK-tree visits
+    nearly every node anyway, so this compares image_dhash to all simhashes in one vectorized pass
+    instead. Simhashes whose first byte alone differs by more than bit_difference_threshold bits are
+    skipped without being compared.
+    """
+    index = get_image_simhash_index()
+    query_sim_hash = np.frombuffer(sim_hash_to_bytes(image_dhash), dtype=np.uint8)
+    reachable_first_bytes = np.flatnonzero(
+        BYTE_POPCOUNT[ALL_BYTE_VALUES ^ query_sim_hash[0]] <= bit_difference_threshold)
+    if len(reachable_first_bytes) == len(ALL_BYTE_VALUES):
+        num_bits_different = BYTE_POPCOUNT[index.sim_hashes ^ query_sim_hash].sum(axis=1)
+        return index.archive_ids[num_bits_different <= bit_difference_threshold]
+
+    offsets = index.first_byte_offsets
+    rows = np.concatenate([np.arange(offsets[b], offsets[b + 1]) for b in reachable_first_bytes])
+    num_bits_different = BYTE_POPCOUNT[index.sim_hashes[rows] ^ query_sim_hash].sum(axis=1)
+    return index.archive_ids[rows[num_bits_different <= bit_difference_threshold]]
 
 def reverse_image_search(image_file_stream, bit_difference_threshold):
     image_dhash = get_image_dhash_as_int(image_file_stream)
     logging.info(
         'Got reverse_image_search request: %s bit_difference_threshold, file with dhash %x',
         bit_difference_threshold, image_dhash)
-    image_simhash_tree = get_image_simhash_bktree()
-
-    found = image_simhash_tree.find(ArchiveIDAndSimHash(sim_hash=image_dhash, archive_id=-1),
-                                    bit_difference_threshold)
-    logging.info('%d similar image archive IDs: %s', len(found), found)
-    # BKTree.find returns tuples of form (bit difference, value). This extracts a set of all
-    # archive IDs found.
-    archive_ids = {x[1].archive_id for x in found}
-    if not archive_ids:
+    archive_ids = find_similar_image_archive_ids(image_dhash, bit_difference_threshold)
+    logging.info('%d similar image archive IDs: %s', len(archive_ids), archive_ids)
+    if not archive_ids.size:
         logging.info('Full text search returned no results.')
         return []
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         return db_interface.ad_cluster_details_for_archive_ids(
-                list(archive_ids), min_date=None, max_date=None, region=None, gender=None,
+                archive_ids.tolist(), min_date=None, max_date=None, region=None, gender=None,
                 age_group=None, language=None, order_by=None, order_direction=None)
 
-def handle_ad_search(topic_id, min_date, max_date, gender, age_group, region, language, order_by,
-                     order_direction, num_requested, offset, full_text_search_query, page_id):
-    if topic_id is not None and full_text_search_query is not None:
-        abort(400, description='topic cannot be combined with full_text_search.')
+def parse_num_requested_and_offset_args(num_requested, offset):
+    """Parse numResults and offset args of ad/cluster search. Aborts with 400 if invalid.
 
+    Returns:
+        (limit, offset) of results to get from the DB (limit None for all results).
+    """
     if num_requested == NUM_REQUESTED_ALL:
-        offset = 0
-        limit = None
-    else:
-        limit = MAX_AD_SEARCH_QUERY_LIMIT
-        try:
-            num_requested = int(num_requested)
-        except ValueError:
-            abort(400, description='numResults must be an integer')
-        try:
-            offset = int(offset)
-        except ValueError:
-            abort(400, description='offset must be an integer')
-        if offset + num_requested > MAX_AD_SEARCH_QUERY_LIMIT:
-            abort(400,
-                  description=(
-                      'sum of numResults and offset must be less than {offset_max}'
-                      ).format(offset_max=MAX_AD_SEARCH_QUERY_LIMIT))
+        return None, 0
+
+    try:
+        num_requested = int(num_requested)
+    except ValueError:
+        abort(400, description='numResults must be an integer')
+    if num_requested < 0:
+        abort(400, description='numResults must not be negative')
+    try:
+        offset = int(offset)
+    except ValueError:
+        abort(400, description='offset must be an integer')
+    if offset < 0:
+        abort(400, description='offset must not be negative')
+    if offset + num_requested > MAX_AD_SEARCH_QUERY_LIMIT:
+        abort(400,
+              description=(
+                  'sum of numResults and offset must be at most {offset_max}'
+                  ).format(offset_max=MAX_AD_SEARCH_QUERY_LIMIT))
+    return num_requested, offset
+
+def parse_size_arg(max_size):
+    """Parse optional size request arg. Aborts with 400 if not an integer from 1 to max_size.
 
+    Returns:
+        int size, or None if size arg was not supplied.
+    """
+    size = request.args.get('size', None)
+    if size is None:
+        return None
+    try:
+        size = int(size)
+    except ValueError:
+        abort(400, description='size must be an integer')
+    if not 1 <= size <= max_size:
+        abort(400, description='size must be between 1 and {}'.format(max_size))
+    return size
+
+def parse_ad_search_filter_args(min_date, max_date, gender, age_group, region, language):
+    """Parse filter args of ad/cluster search to values to filter by (None for no filter).
 
+    Returns:
+        (min_date, max_date, gender, age_group, region, language)
+    """
     # This date parsing is needed because the FE passes raw UTC formatted dates in Zulu time
     # We can simplify this by not sending the time at all from the FE. Then we strip the time info
     # and just take the date for simplicity.
     if min_date and max_date:
-        try:
-            min_date = datetime.datetime.strptime(
-                min_date, "%Y-%m-%dT%H:%M:%S.%fZ").date()
-        except ValueError:
-            min_date = date_utils.parse_date_arg(min_date)
-
-        try:
-            max_date = datetime.datetime.strptime(
-                max_date, "%Y-%m-%dT%H:%M:%S.%fZ").date()
-        except ValueError:
-            max_date = date_utils.parse_date_arg(max_date)
+        min_date = parse_zulu_time_or_date_arg(min_date)
+        max_date = parse_zulu_time_or_date_arg(max_date)
 
     gender = ad_filtering_utils.parse_gender_value(gender)
     region = ad_filtering_utils.parse_region_label_to_value(region)
     age_group = ad_filtering_utils.parse_age_range_value(age_group)
     if language and language.lower() == 'all':
         language = None
+    return min_date, max_date, gender, age_group, region, language
+
+def handle_ad_search(topic_id, min_date, max_date, gender, age_group, region, language, order_by,
+                     order_direction, num_requested, offset, full_text_search_query, page_id):
+    if topic_id is not None and full_text_search_query is not None:
+        abort(400, description='topic cannot be combined with full_text_search.')
+
+    limit, offset = parse_num_requested_and_offset_args(num_requested, offset)
+    min_date, max_date, gender, age_group, region, language = parse_ad_search_filter_args(
+        min_date, max_date, gender, age_group, region, language)
 
     if full_text_search_query:
         results =  get_ad_data_from_full_text_search(
             full_text_search_query, page_id=page_id, min_date=min_date, max_date=max_date,
             region=region, gender=gender, age_group=age_group, language=language, order_by=order_by,
-            order_direction=order_direction, limit=limit)
+            order_direction=order_direction, limit=limit, offset=offset)
 
     elif page_id:
         results = get_ad_data_for_page_id(page_id, min_date=min_date, max_date=max_date,
                                           region=region, gender=gender, age_group=age_group,
                                           language=language, topic_id=topic_id, order_by=order_by,
-                                          order_direction=order_direction, limit=limit)
+                                          order_direction=order_direction, limit=limit,
+                                          offset=offset)
     else:
         results = get_ad_data_for_topic(
             topic_id, min_date=min_date, max_date=max_date, region=region, gender=gender,
             age_group=age_group, language=language, order_by=order_by,
-            order_direction=order_direction, limit=limit)
-
-    if limit:
-        logging.debug('returning results[%s:%s] of %d results', offset, (offset + num_requested),
-                      len(results))
-        return results[offset:(offset+num_requested)]
+            order_direction=order_direction, limit=limit, offset=offset)
 
     return results
 
@@ -473,8 +620,10 @@ def get_ads():
         order_direction, num_requested, offset, full_text_search_query, page_id)
     logging.info('handle_ad_search returned %d ads', len(ad_data))
 
-    return Response(json.dumps([get_ad_record(row) for row in ad_data]),
-                    mimetype='application/json')
+    screenshot_url_prefix = ad_filtering_utils.ad_screenshot_url_prefix()
+    return Response(
+        json_utils.dumps([get_ad_record(row, screenshot_url_prefix) for row in ad_data]),
+        mimetype='application/json')
 
 def handle_ad_cluster_search(topic_id, min_date, max_date, gender, age_group, region, language,
                              order_by, order_direction, num_requested, offset,
@@ -482,70 +631,28 @@ def handle_ad_cluster_search(topic_id, min_date, max_date, gender, age_group, re
     if topic_id is not None and full_text_search_query is not None:
         abort(400, description='topic cannot be combined with full_text_search.')
 
-    if num_requested == NUM_REQUESTED_ALL:
-        offset = 0
-        limit = None
-    else:
-        limit = MAX_AD_SEARCH_QUERY_LIMIT
-        try:
-            num_requested = int(num_requested)
-        except ValueError:
-            abort(400, description='numResults must be an integer')
-        try:
-            offset = int(offset)
-        except ValueError:
-            abort(400, description='offset must be an integer')
-        if offset + num_requested > MAX_AD_SEARCH_QUERY_LIMIT:
-            abort(400,
-                  description=(
-                      'sum of numResults and offset must be less than {offset_max}'
-                      ).format(offset_max=MAX_AD_SEARCH_QUERY_LIMIT))
-
-
-    # This date parsing is needed because the FE passes raw UTC formatted dates in Zulu time
-    # We can simplify this by not sending the time at all from the FE. Then we strip the time info
-    # and just take the date for simplicity.
-    if min_date and max_date:
-        try:
-            min_date = datetime.datetime.strptime(
-                min_date, "%Y-%m-%dT%H:%M:%S.%fZ").date()
-        except ValueError:
-            min_date = date_utils.parse_date_arg(min_date)
-
-        try:
-            max_date = datetime.datetime.strptime(
-                max_date, "%Y-%m-%dT%H:%M:%S.%fZ").date()
-        except ValueError:
-            max_date = date_utils.parse_date_arg(max_date)
-
-    gender = ad_filtering_utils.parse_gender_value(gender)
-    region = ad_filtering_utils.parse_region_label_to_value(region)
-    age_group = ad_filtering_utils.parse_age_range_value(age_group)
-    if language and language.lower() == 'all':
-        language = None
+    limit, offset = parse_num_requested_and_offset_args(num_requested, offset)
+    min_date, max_date, gender, age_group, region, language = parse_ad_search_filter_args(
+        min_date, max_date, gender, age_group, region, language)
 
 
     if full_text_search_query:
         results = get_ad_cluster_data_from_full_text_search(
             full_text_search_query, page_id=page_id, min_date=min_date, max_date=max_date,
             region=region, gender=gender, age_group=age_group, language=language, order_by=order_by,
-            order_direction=order_direction, limit=limit)
+            order_direction=order_direction, limit=limit, offset=offset)
 
     elif page_id:
         results = get_ad_cluster_data_for_page_id(
             page_id=page_id, min_date=min_date, max_date=max_date, region=region, gender=gender,
             age_group=age_group, language=language, topic_id=topic_id, order_by=order_by,
-            order_direction=order_direction, limit=limit)
+            order_direction=order_direction, limit=limit, offset=offset)
     else:
         results = get_ad_cluster_data_for_topic(
                 topic_id, min_date=min_date, max_date=max_date, region=region, gender=gender,
                 age_group=age_group, language=language, order_by=order_by,
-                order_direction=order_direction, limit=limit, min_topic_percentage_threshold=0.25)
-
-    if limit:
-        logging.debug('returning results[%s:%s] of %d results', offset, (offset + num_requested),
-                      len(results))
-        return results[offset:(offset+num_requested)]
+                order_direction=order_direction, limit=limit, offset=offset,
+                min_topic_percentage_threshold=0.25)
 
     return results
 
@@ -556,7 +663,7 @@ def handle_ad_cluster_search(topic_id, min_date, max_date, gender, age_group, re
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
 def get_ad_clusters():
-    return Response(json.dumps(get_ad_clusters_data(request)), mimetype='application/json')
+    return Response(json_utils.dumps(get_ad_clusters_data(request)), mimetype='application/json')
 
 def get_ad_clusters_data(request):
     if request.method == 'POST':
@@ -592,161 +699,121 @@ def get_ad_clusters_data(request):
             topic_id, min_date, max_date, gender, age_group, region, language, order_by,
             order_direction, num_requested, offset, full_text_search_query, page_id)
 
-    return [get_ad_cluster_record(row) for row in ad_cluster_data]
-
+    screenshot_url_prefix = ad_filtering_utils.ad_screenshot_url_prefix()
+    return [get_ad_cluster_record(row, screenshot_url_prefix) for row in ad_cluster_data]
 
-def cluster_additional_ads(db_interface, ad_cluster_id):
-    return list(db_interface.ad_cluster_archive_ids(ad_cluster_id))
-
-def cluster_advertiser_info(db_interface, ad_cluster_id):
-    advertiser_info = db_interface.ad_cluster_advertiser_info(ad_cluster_id)
-    return format_advertiser_info(advertiser_info)
-
-def ad_advertiser_info(db_interface, archive_id):
-    advertiser_info = db_interface.ad_advertiser_info(archive_id)
-    return format_advertiser_info(advertiser_info)
 
 def format_advertiser_info(advertiser_info):
-    ret = []
-    for row in advertiser_info:
-        ret.append({'advertiser_type': row['page_type'], 'advertiser_party': row['party'],
-                    'advertiser_fec_id': row['fec_id'], 'advertiser_webiste': row['page_url'],
-                    'advertiser_risk_score': str(row['advertiser_score']),
-                    'facebook_page_id': row['page_id'], 'facebook_page_name': row['page_name']})
-    return ret
+    return [{'advertiser_type': row['page_type'], 'advertiser_party': row['party'],
+             'advertiser_fec_id': row['fec_id'], 'advertiser_webiste': row['page_url'],
+             'advertiser_risk_score': str(row['advertiser_score']),
+             'facebook_page_id': row['page_id'], 'facebook_page_name': row['page_name']}
+            for row in advertiser_info]
 
 @blueprint.route('/ads/<int:archive_id>')
-@caching.global_cache.cached(query_string=True,
+@caching.global_cache.cached(query_string=False,
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_control_max_age(date_utils.SIX_HOURS_IN_SECONDS)
 def get_ad_details(archive_id):
-    return Response(json.dumps(ad_details(archive_id)), mimetype='application/json')
+    return Response(json_utils.dumps(ad_details(archive_id)), mimetype='application/json')
 
 def ad_details(archive_id):
-    db_connection = db_functions.get_fb_ads_database_connection()
-    db_interface = db_functions.FBAdsDBInterface(db_connection)
-
-    ad_data = defaultdict(list)
-    ad_data['archive_id'] = archive_id
-    region_impression_results = db_interface.ad_region_impression_results(archive_id)
-    for row in region_impression_results:
-        ad_data['region_impression_results'].append(
-            {'region': row['region'],
-             'min_spend': row['min_spend'],
-             'max_spend': row['max_spend'],
-             'min_impressions': row['min_impressions'],
-             'max_impressions': row['max_impressions']})
-
-    demo_impression_results = db_interface.ad_demo_impression_results(archive_id)
-    for row in demo_impression_results:
-        ad_data['demo_impression_results'].append({
-            'age_group': row['age_group'],
-            'gender': row['gender'],
-            'min_spend': row['min_spend'],
-            'max_spend': row['max_spend'],
-            'min_impressions': row['min_impressions'],
-            'max_impressions': row['max_impressions']})
-
-    topics = db_interface.ad_topics(archive_id)
-    if topics:
-        ad_data['topics'] = ', '.join(topics)
-
-    ad_data['advertiser_info'] = ad_advertiser_info(db_interface, archive_id)
-    ad_data['funding_entity'] = list(db_interface.ad_funder_names(archive_id))
-    ad_timing_and_impressions_data = db_interface.ad_timing_and_impressions_data(archive_id)
-    ad_data['min_spend'] = ad_timing_and_impressions_data['min_spend']
-    ad_data['max_spend'] = ad_timing_and_impressions_data['max_spend']
-    ad_data['min_impressions'] = ad_timing_and_impressions_data['min_impressions']
-    ad_data['max_impressions'] = ad_timing_and_impressions_data['max_impressions']
-    ad_data['currency'] = ad_timing_and_impressions_data['currency']
-    ad_data['ad_creation_date'] = (
-        ad_timing_and_impressions_data['ad_delivery_start_time'].isoformat())
-    ad_data['last_active_date'] = ad_timing_and_impressions_data['last_active_date'].isoformat()
+    with db_functions.get_fb_ads_database_connection() as db_connection:
+        db_interface = db_functions.FBAdsDBInterface(db_connection)
+        ad_details_data = db_interface.ad_details(archive_id)
+
+    ad_data = {'archive_id': archive_id}
+    # Impression results are serialized by the query with the keys used in responses.
+    ad_data['region_impression_results'] = json_utils.raw_json(
+        ad_details_data['region_impression_results'])
+    ad_data['demo_impression_results'] = json_utils.raw_json(
+        ad_details_data['demo_impression_results'])
+
+    if ad_details_data['topics']:
+        ad_data['topics'] = ad_details_data['topics']
+
+    ad_data['advertiser_info'] = format_advertiser_info(ad_details_data['advertiser_info'])
+    ad_data['funding_entity'] = ad_details_data['funding_entities']
+    ad_data['min_spend'] = ad_details_data['min_spend']
+    ad_data['max_spend'] = ad_details_data['max_spend']
+    ad_data['min_impressions'] = ad_details_data['min_impressions']
+    ad_data['max_impressions'] = ad_details_data['max_impressions']
+    ad_data['currency'] = ad_details_data['currency']
+    # Serialized in ISO format by json_utils.
+    ad_data['ad_creation_date'] = ad_details_data['ad_delivery_start_time']
+    ad_data['last_active_date'] = ad_details_data['last_active_date']
     ad_data['url'] = ad_filtering_utils.make_ad_screenshot_url(archive_id)
     # These fields are generated by NYU and show up in the Metadata tab
-    ad_data['type'] = ', '.join(db_interface.ad_types(archive_id))
-    ad_data['entities'] = ', '.join(db_interface.ad_recognized_entities(archive_id))
-    language_code_to_name = make_language_code_to_name_map(db_interface.ad_languages(archive_id))
-    ad_data['languages'] = [language_code_to_name.get(lang, None) for lang in language_code_to_name]
+    ad_data['type'] = ad_details_data['ad_types']
+    ad_data['entities'] = ad_details_data['recognized_entities']
+    ad_data['languages'] = [LANGUAGE_CODE_TO_NAME.get(language_code, language_code)
+                            for language_code in ad_details_data['languages']]
 
     return ad_data
 
 
 @blueprint.route('/ad-clusters/<int:ad_cluster_id>')
-@caching.global_cache.cached(query_string=True,
+@caching.global_cache.cached(query_string=False,
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_control_max_age(date_utils.SIX_HOURS_IN_SECONDS)
 def get_ad_cluster_details(ad_cluster_id):
-    db_connection = db_functions.get_fb_ads_database_connection()
-    db_interface = db_functions.FBAdsDBInterface(db_connection)
-
-    ad_cluster_data = defaultdict(list)
-    ad_cluster_data['ad_cluster_id'] = ad_cluster_id
-    region_impression_results = db_interface.ad_cluster_region_impression_results(ad_cluster_id)
-    for row in region_impression_results:
-        ad_cluster_data['region_impression_results'].append(
-            {'region': row['region'],
-             'min_spend': row['min_spend_sum'],
-             'max_spend': row['max_spend_sum'],
-             'min_impressions': row['min_impressions_sum'],
-             'max_impressions': row['max_impressions_sum']})
-
-    demo_impression_results = db_interface.ad_cluster_demo_impression_results(ad_cluster_id)
-    for row in demo_impression_results:
-        ad_cluster_data['demo_impression_results'].append({
-            'age_group': row['age_group'],
-            'gender': row['gender'],
-            'min_spend': row['min_spend_sum'],
-            'max_spend': row['max_spend_sum'],
-            'min_impressions': row['min_impressions_sum'],
-            'max_impressions': row['max_impressions_sum']})
-
-    cluster_topics = db_interface.ad_cluster_topics(ad_cluster_id)
-    if cluster_topics:
-        ad_cluster_data['topics'] = ', '.join(cluster_topics)
-
-    ad_cluster_data['advertiser_info'] = cluster_advertiser_info(db_interface, ad_cluster_id)
-    ad_cluster_data['funding_entity'] = list(db_interface.ad_cluster_funder_names(ad_cluster_id))
-    ad_cluster_metadata = db_interface.ad_cluster_metadata(ad_cluster_id)
-    ad_cluster_data['min_spend_sum'] = ad_cluster_metadata['min_spend_sum']
-    ad_cluster_data['max_spend_sum'] = ad_cluster_metadata['max_spend_sum']
-    ad_cluster_data['min_impressions_sum'] = ad_cluster_metadata['min_impressions_sum']
-    ad_cluster_data['max_impressions_sum'] = ad_cluster_metadata['max_impressions_sum']
-    ad_cluster_data['cluster_size'] = ad_cluster_metadata['cluster_size']
-    ad_cluster_data['num_pages'] = ad_cluster_metadata['num_pages']
-    canonical_archive_id = ad_cluster_metadata['canonical_archive_id']
+    with db_functions.get_fb_ads_database_connection() as db_connection:
+        db_interface = db_functions.FBAdsDBInterface(db_connection)
+        ad_cluster_details_data = db_interface.ad_cluster_details(ad_cluster_id)
+
+    ad_cluster_data = {'ad_cluster_id': ad_cluster_id}
+    # Impression results are serialized by the query with the keys used in responses.
+    ad_cluster_data['region_impression_results'] = json_utils.raw_json(
+        ad_cluster_details_data['region_impression_results'])
+    ad_cluster_data['demo_impression_results'] = json_utils.raw_json(
+        ad_cluster_details_data['demo_impression_results'])
+
+    if ad_cluster_details_data['topics']:
+        ad_cluster_data['topics'] = ad_cluster_details_data['topics']
+
+    ad_cluster_data['advertiser_info'] = format_advertiser_info(
+        ad_cluster_details_data['advertiser_info'])
+    ad_cluster_data['funding_entity'] = ad_cluster_details_data['funding_entities']
+    ad_cluster_data['min_spend_sum'] = ad_cluster_details_data['min_spend_sum']
+    ad_cluster_data['max_spend_sum'] = ad_cluster_details_data['max_spend_sum']
+    ad_cluster_data['min_impressions_sum'] = ad_cluster_details_data['min_impressions_sum']
+    ad_cluster_data['max_impressions_sum'] = ad_cluster_details_data['max_impressions_sum']
+    ad_cluster_data['cluster_size'] = ad_cluster_details_data['cluster_size']
+    ad_cluster_data['num_pages'] = ad_cluster_details_data['num_pages']
+    canonical_archive_id = ad_cluster_details_data['canonical_archive_id']
     ad_cluster_data['canonical_archive_id'] = canonical_archive_id
-    ad_cluster_data['min_ad_creation_date'] = (
-        ad_cluster_metadata['min_ad_delivery_start_time'].isoformat())
-    ad_cluster_data['max_ad_creation_date'] = (
-        ad_cluster_metadata['max_last_active_date'].isoformat())
+    # Serialized in ISO format by json_utils.
+    ad_cluster_data['min_ad_creation_date'] = ad_cluster_details_data['min_ad_delivery_start_time']
+    ad_cluster_data['max_ad_creation_date'] = ad_cluster_details_data['max_last_active_date']
     ad_cluster_data['url'] = ad_filtering_utils.make_ad_screenshot_url(canonical_archive_id)
-    ad_cluster_data['archive_ids'] = cluster_additional_ads(db_interface, ad_cluster_id)
+    ad_cluster_data['archive_ids'] = ad_cluster_details_data['archive_ids']
     # These fields are generated by NYU and show up in the Metadata tab
-    ad_cluster_data['type'] = ', '.join(db_interface.ad_cluster_types(ad_cluster_id))
-    ad_cluster_data['entities'] = ', '.join(db_interface.ad_cluster_recognized_entities(
-        ad_cluster_id))
-    language_code_to_name = get_cluster_languages_code_to_name()
-    ad_cluster_data['languages'] = [language_code_to_name.get(lang, None) for lang in
-                                    db_interface.ad_cluster_languages(ad_cluster_id)]
-    ad_cluster_data['currencies'] = db_interface.ad_cluster_currencies(ad_cluster_id)
+    ad_cluster_data['type'] = ad_cluster_details_data['ad_types']
+    ad_cluster_data['entities'] = ad_cluster_details_data['recognized_entities']
+    ad_cluster_data['languages'] = [LANGUAGE_CODE_TO_NAME.get(language_code, language_code)
+                                    for language_code in ad_cluster_details_data['languages']]
+    ad_cluster_data['currencies'] = ad_cluster_details_data['currencies']
 
-    return Response(json.dumps(ad_cluster_data), mimetype='application/json')
+    return Response(json_utils.dumps(ad_cluster_data), mimetype='application/json')
 
 @blueprint.route('/archive-id/<int:archive_id>/cluster')
-@caching.global_cache.cached(query_string=True,
+@caching.global_cache.cached(query_string=False,
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_control_max_age(date_utils.SIX_HOURS_IN_SECONDS)
 def get_cluster_id_from_archive_id(archive_id):
     with db_functions.get_fb_ads_database_connection() as db_connection:
         db_interface = db_functions.FBAdsDBInterface(db_connection)
         ad_cluster_id = db_interface.get_cluster_id_from_archive_id(archive_id)
     if ad_cluster_id is None:
-        abort(404)
-    return Response(json.dumps({'cluster_id': ad_cluster_id}), mimetype='application/json')
+        # Returned rather than aborted so that the not found response is cached too.
+        return Response(status=404, mimetype='application/json')
+    return Response(json_utils.dumps({'cluster_id': ad_cluster_id}), mimetype='application/json')
 
 @blueprint.route('/pages/<int:page_id>')
-@caching.global_cache.cached(query_string=True,
+@caching.global_cache.cached(query_string=False,
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
 def get_page_data(page_id):
@@ -757,13 +824,14 @@ def get_page_data(page_id):
             page_data['owned_pages'] = db_interface.owned_pages(page_id)
 
     if page_data:
-        return Response(json.dumps(page_data), mimetype='application/json')
+        return Response(json_utils.dumps(page_data), mimetype='application/json')
     return Response(status=404, mimetype='application/json')
 
 @blueprint.route('/search/pages_type_ahead')
 @caching.global_cache.cached(query_string=True,
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_control_max_age(date_utils.ONE_HOUR_IN_SECONDS)
 def pages_type_ahead():
     '''
     This endpoint accepts a query parameter (q) and uses that parameter to perform an
@@ -777,20 +845,20 @@ def pages_type_ahead():
     query['query'] = {}
 
     # Process size parameter if supplied
-    size = request.args.get('size', None)
+    size = parse_size_arg(MAX_AD_SEARCH_QUERY_LIMIT)
     if size is not None:
         query['size'] = size
 
     # Process query term
     q_arg = request.args.get('q', None)
+    if q_arg is None:
+        abort(400, 'The q_arg parameter is required for this endpoint.')
+
     query['query']['bool'] = {
         'must': [{'match': {'page_name.ngram': q_arg}}],
         'should': [{'rank_feature': {'field': 'lifelong_amount_spent',
                                      'log': {'scaling_factor': 1}}}]}
 
-    if q_arg is None:
-        abort(400, 'The q_arg parameter is required for this endpoint.')
-
     elastic_search_api_params = current_app.config['FB_ADS_ELASTIC_SEARCH_API_PARAMS']
     logging.debug('Sending type ahead request to %s query: %s', elastic_search_api_params.client,
                   query)
@@ -805,25 +873,27 @@ def pages_type_ahead():
     data['metadata'] = {}
     data['metadata']['total'] = response['hits']['total']
     data['metadata']['execution_time_in_millis'] = round((time.time() - start_time) * 1000, 2)
-    return Response(json.dumps(data), mimetype='application/json')
+    return Response(json_utils.dumps(data), mimetype='application/json')
 
 @blueprint.route("/search/archive_ids")
 @caching.global_cache.cached(query_string=True,
                              response_filter=caching.cache_if_response_no_server_error,
                              timeout=date_utils.SIX_HOURS_IN_SECONDS)
+@caching.cache_control_max_age(date_utils.SIX_HOURS_IN_SECONDS)
 def get_archive_ids_from_full_text_search():
     '''
     This endpoint returns archive ids that match specific page ids or keywords (matched against the
     ad creative body).
     '''
     # Process size parameter if supplied
-    size = request.args.get('size', None)
+    size = parse_size_arg(MAX_ELASTIC_SEARCH_RESULTS)
     body = request.args.get('body', None)
     funding_entity = request.args.get('funding_entity', None)
     page_id = request.args.get('page_id', None)
     ad_delivery_start_time = request.args.get('ad_delivery_start_time', None)
     ad_delivery_stop_time = request.args.get('ad_delivery_stop_time', None)
-    archive_ids_only = request.args.get('archive_ids_only', True)
+    archive_ids_only = request.args.get('archive_ids_only', 'true').lower() not in (
+        '0', 'false', 'no')
     es_api_params = current_app.config['FB_ADS_ELASTIC_SEARCH_API_PARAMS']
     search_results = elastic_search.query_elastic_search_fb_ad_creatives_index(
         elastic_search_api_params=es_api_params,
@@ -834,4 +904,4 @@ def get_archive_ids_from_full_text_search():
         ad_delivery_stop_time=ad_delivery_stop_time,
         max_results=size,
         return_archive_ids_only=archive_ids_only)
-    return Response(json.dumps(search_results), mimetype='application/json')
+    return Response(json_utils.dumps(search_results), mimetype='application/json')
@@ -0,0 +1,132 @@
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from blueprints.common import ads_search
+
+NUM_SIM_HASH_BITS = ads_search.SIM_HASH_NUM_BYTES * 8
+# bit_difference_thresholds to compare against brute force, including all the reverse image search
+# thresholds, 0 and all of the bits of a simhash.
+BIT_DIFFERENCE_THRESHOLDS = sorted(
+    set(ads_search.AD_SCREENER_REVERSE_IMAGE_SEARCH_NAME_TO_BIT_THRESHOLD.values()) |
+    {0, 1, 4, 8, 16, 32, 64, NUM_SIM_HASH_BITS})
+# First byte of none of the simhashes in the test index.
+EMPTY_FIRST_BYTE = 0
+
+
+def first_byte(sim_hash):
+    return sim_hash >> (NUM_SIM_HASH_BITS - 8)
+
+
+def with_first_byte(sim_hash, new_first_byte):
+    first_byte_shift = NUM_SIM_HASH_BITS - 8
+    return (sim_hash & ~(0xff << first_byte_shift)) | (new_first_byte << first_byte_shift)
+
+
+def brute_force_similar_archive_ids(simhash_to_archive_id, query_sim_hash,
+                                    bit_difference_threshold):
+    return sorted(archive_id for sim_hash, archive_id in simhash_to_archive_id.items()
+                  if bin(sim_hash ^ query_sim_hash).count('1') <= bit_difference_threshold)
+
+
+class TestImageSimHashIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        base_sim_hashes = [rng.getrandbits(NUM_SIM_HASH_BITS) for _ in range(50)]
+        # Add near duplicates of each simhash so that small thresholds have matches too.
+        sim_hashes = set(base_sim_hashes)
+        for sim_hash in base_sim_hashes:
+            for _ in range(20):
+                for bit in rng.sample(range(NUM_SIM_HASH_BITS), rng.randint(1, 40)):
+                    sim_hash ^= 1 << bit
+                sim_hashes.add(sim_hash)
+        sim_hashes = sorted(sim_hash for sim_hash in sim_hashes
+                            if first_byte(sim_hash) != EMPTY_FIRST_BYTE)
+        self.simhash_to_archive_id = {
+            sim_hash: archive_id for archive_id, sim_hash in enumerate(sim_hashes, 1000)}
+        self.index = ads_search.make_image_simhash_index(self.simhash_to_archive_id)
+        self.query_sim_hashes = (base_sim_hashes[:10] +
+                                 [rng.getrandbits(NUM_SIM_HASH_BITS) for _ in range(5)])
+
+    def find_similar_archive_ids(self, index, query_sim_hash, bit_difference_threshold):
+        with mock.patch.object(ads_search, 'get_image_simhash_index', return_value=index):
+            return sorted(ads_search.find_similar_image_archive_ids(
+                query_sim_hash, bit_difference_threshold).tolist())
+
+    def assert_search_matches_brute_force(self, index, query_sim_hashes):
+        for bit_difference_threshold in BIT_DIFFERENCE_THRESHOLDS:
+            for query_sim_hash in query_sim_hashes:
+                with self.subTest(bit_difference_threshold=bit_difference_threshold,
+                                  query_sim_hash=query_sim_hash):
+                    self.assertEqual(
+                        self.find_similar_archive_ids(index, query_sim_hash,
+                                                      bit_difference_threshold),
+                        brute_force_similar_archive_ids(
+                            self.simhash_to_archive_id, query_sim_hash,
+                            bit_difference_threshold))
+
+    def test_first_byte_offsets(self):
+        offsets = self.index.first_byte_offsets
+        self.assertEqual(len(offsets), 257)
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(offsets[-1], len(self.simhash_to_archive_id))
+        for first_byte_value in range(256):
+            self.assertTrue(np.all(
+                self.index.sim_hashes[offsets[first_byte_value]:offsets[first_byte_value + 1], 0] ==
+                first_byte_value))
+
+    def test_find_similar_image_archive_ids(self):
+        self.assert_search_matches_brute_force(self.index, self.query_sim_hashes)
+
+    def test_query_with_empty_first_byte_bucket(self):
+        offsets = self.index.first_byte_offsets
+        self.assertEqual(offsets[EMPTY_FIRST_BYTE], offsets[EMPTY_FIRST_BYTE + 1])
+        query_sim_hashes = [with_first_byte(sim_hash, EMPTY_FIRST_BYTE)
+                            for sim_hash in self.query_sim_hashes]
+        self.assert_search_matches_brute_force(self.index, query_sim_hashes)
+        # Only the empty bucket is reachable at threshold 0.
+        self.assertEqual(self.find_similar_archive_ids(self.index, query_sim_hashes[0], 0), [])
+
+    def test_bit_difference_exactly_at_threshold(self):
+        rng = random.Random(1)
+        sim_hash, archive_id = next(iter(self.simhash_to_archive_id.items()))
+        for bit_difference in BIT_DIFFERENCE_THRESHOLDS[1:]:
+            query_sim_hash = sim_hash
+            for bit in rng.sample(range(NUM_SIM_HASH_BITS), bit_difference):
+                query_sim_hash ^= 1 << bit
+            with self.subTest(bit_difference=bit_difference):
+                self.assertIn(archive_id, self.find_similar_archive_ids(
+                    self.index, query_sim_hash, bit_difference))
+                self.assertNotIn(archive_id, self.find_similar_archive_ids(
+                    self.index, query_sim_hash, bit_difference - 1))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as index_dir, \
+                mock.patch.object(ads_search, 'IMAGE_SIMHASH_INDEX_DIR', index_dir):
+            ads_search.save_image_simhash_index(self.index)
+            loaded_index, saved_at = ads_search.load_image_simhash_index()
+            self.assertIsNotNone(loaded_index)
+            self.assertTrue(ads_search.image_simhash_index_is_fresh(saved_at))
+            for field in ads_search.ImageSimHashIndex._fields:
+                np.testing.assert_array_equal(getattr(loaded_index, field),
+                                              getattr(self.index, field))
+            self.assert_search_matches_brute_force(loaded_index, self.query_sim_hashes)
+
+    def test_load_without_saved_index(self):
+        with tempfile.TemporaryDirectory() as index_dir, \
+                mock.patch.object(ads_search, 'IMAGE_SIMHASH_INDEX_DIR', index_dir):
+            self.assertEqual(ads_search.load_image_simhash_index(), (None, None))
+
+    def test_load_of_arrays_from_different_saves(self):
+        smaller_index = ads_search.make_image_simhash_index(
+            dict(list(self.simhash_to_archive_id.items())[:10]))
+        with tempfile.TemporaryDirectory() as index_dir, \
+                mock.patch.object(ads_search, 'IMAGE_SIMHASH_INDEX_DIR', index_dir):
+            ads_search.save_image_simhash_index(self.index)
+            # Simulate loading while another worker is partway through saving.
+            with open(ads_search.image_simhash_index_file_paths().archive_ids, 'wb') as f:
+                np.save(f, smaller_index.archive_ids)
+            self.assertEqual(ads_search.load_image_simhash_index(), (None, None))
@@ -1,5 +1,6 @@
 import json
 import datetime
+import gzip
 from urllib.parse import unquote
 
 from flask import (
@@ -8,38 +9,72 @@ from flask import (
     Blueprint,
     abort
 )
-from flask.json import JSONEncoder
 
 from blueprints.google_dashboard import queries
 
 import db_functions
-from common import caching, date_utils
+from common import caching, date_utils, json_utils
 
-DEFAULT_PAGE_SIZE = "30"
+DEFAULT_PAGE_SIZE = 30
 MAX_PAGE_SIZE = 300
 URL_PREFIX = "/ytapi/v1"
 DEFAULT_START_DATE = "2021-01-07"
 
 
-class CustomJSONEncoder(JSONEncoder):
-    def default(self, o):
-        try:
-            if isinstance(o, (datetime.date, datetime.datetime)):
-                return o.isoformat()
-            iterable = iter(o)
-        except TypeError:
-            pass
-        else:
-            return list(iterable)
-        return JSONEncoder.default(self, o)
+def _default(o):
+    # datetime.date/datetime.datetime and dataclass models are serialized natively by orjson, so
+    # only the fallback for other iterables (ex: SQLAlchemy result rows) remains.
+    try:
+        iterable = iter(o)
+    except TypeError:
+        raise TypeError("Type is not JSON serializable: %s" % type(o).__name__) from None
+    return list(iterable)
+
+
+def _page_and_page_size():
+    """Returns (page, page_size) request args, falling back to the defaults if they are missing or
+    not ints, with page_size capped at MAX_PAGE_SIZE."""
+    page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", DEFAULT_PAGE_SIZE, type=int)
+    return page, min(page_size, MAX_PAGE_SIZE)
+
+
+def _json_response(payload):
+    # Handlers are cached, so the body is compressed, and hashed for the ETag, once per cache fill
+    # instead of on every request. Only the gzipped body is cached; _gunzip_if_not_accepted
+    # decompresses it for the (rare) clients that don't accept gzip.
+    body = json_utils.dumps(payload, default=_default)
+    resp = Response(gzip.compress(body, compresslevel=6, mtime=0), mimetype="application/json")
+    resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    resp.add_etag()
+    resp.cache_control.public = True
+    resp.cache_control.max_age = date_utils.ONE_DAY_IN_SECONDS
+    return resp
+
+
+def _gunzip_if_not_accepted(resp):
+    """after_request handler which decompresses gzipped bodies made by _json_response if the client
+    does not accept gzip encoding."""
+    if (
+        resp.status_code != 200
+        or resp.headers.get("Content-Encoding") != "gzip"
+        or "gzip" in request.accept_encodings
+    ):
+        return resp
+    resp.set_data(gzip.decompress(resp.get_data()))
+    del resp.headers["Content-Encoding"]
+    etag, is_weak = resp.get_etag()
+    # ETag must differ from the one of the gzipped body.
+    resp.set_etag(etag + "-identity", weak=is_weak)
+    return resp
 
 
 google_dashboard_blueprint = Blueprint(
     "google_dashboard", __name__, template_folder="templates"
 )
-
-google_dashboard_blueprint.json_encoder = CustomJSONEncoder
-
+# Runs before the parent ad_observatory_api blueprint's make_response_conditional.
+google_dashboard_blueprint.after_request(_gunzip_if_not_accepted)
 
 # NOT YET DONE
 #  - Regions: political ads targeted to a state/CBSA.. (only for political ads, based on the targeting in creative stats...),  search regions on search page (maybe)
@@ -67,8 +102,7 @@ google_dashboard_blueprint.json_encoder = CustomJSONEncoder
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def top_political_advertisers_since_date(region="US"):
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     start_date = request.args.get("start_date", DEFAULT_START_DATE)
     end_date = request.args.get("end_date", datetime.date.today())
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
@@ -84,20 +118,17 @@ def top_political_advertisers_since_date(region="US"):
             page=page,
             page_size=page_size,
         )
-        return Response(
-            json.dumps(
-                {
-                    "political_advertisers": [
-                        {"advertiser_name": name, "spend": spend}
-                        for name, spend in query_results
-                    ],
-                    "region": region,
-                    "start_date": effective_start_date.isoformat(),
-                    "end_date": effective_end_date.isoformat(),
-                    "page": page,
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "political_advertisers": [
+                    {"advertiser_name": name, "spend": spend}
+                    for name, spend in query_results
+                ],
+                "region": region,
+                "start_date": effective_start_date.isoformat(),
+                "end_date": effective_end_date.isoformat(),
+                "page": page,
+            }
         )
 
 
@@ -108,8 +139,7 @@ def top_political_advertisers_since_date(region="US"):
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def top_advertisers_since_date():
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     start_date = request.args.get("start_date", DEFAULT_START_DATE)
     end_date = request.args.get("end_date", datetime.date.today())
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
@@ -120,14 +150,9 @@ def top_advertisers_since_date():
             page=page,
             page_size=page_size,
         )
-        return Response(
-            json.dumps({"result": query_results, "page": page}),
-            mimetype="application/json",
-        )
+        return _json_response({"result": query_results, "page": page})
 
 
-flatten = lambda t: [item for sublist in t for item in sublist]
-
 # e.g. http://localhost:5000/advertiser/AR227673879898750976/political_ads for Warnock
 @google_dashboard_blueprint.route("/advertiser/<advertiser_name>/political_ads")
 @caching.global_cache.cached(
@@ -136,8 +161,7 @@ flatten = lambda t: [item for sublist in t for item in sublist]
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def advertiser_ads(advertiser_name):
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     start_date = request.args.get("start_date", DEFAULT_START_DATE)
     end_date = request.args.get("end_date", None)
     advertiser_name = unquote(advertiser_name)
@@ -152,21 +176,18 @@ def advertiser_ads(advertiser_name):
             page_size=page_size,
         )
 
-        return Response(
-            json.dumps(
-                {
-                    "political_ads": [
-                        {
-                            "google_ad_creative": google_ad_creative,
-                            "youtube_video": google_ad_creative.youtube_video,
-                            "creative_stat": google_ad_creative.creative_stat,
-                            "advertiser": google_ad_creative.advertiser,
-                        }
-                        for google_ad_creative in political_ads
-                    ],
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "political_ads": [
+                    {
+                        "google_ad_creative": google_ad_creative,
+                        "youtube_video": google_ad_creative.youtube_video,
+                        "creative_stat": google_ad_creative.creative_stat,
+                        "advertiser": google_ad_creative.advertiser,
+                    }
+                    for google_ad_creative in political_ads
+                ],
+            }
         )
 
 
@@ -177,8 +198,7 @@ def advertiser_ads(advertiser_name):
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def advertiser_ads_by_same_uploader(advertiser_name):
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     start_date = request.args.get("start_date", DEFAULT_START_DATE)
     advertiser_name = unquote(advertiser_name)
 
@@ -188,27 +208,23 @@ def advertiser_ads_by_same_uploader(advertiser_name):
     )  # the reason we use this endpoint is to find ads from the same uploader that aren't in the archive (since those are maybe missed ads, or non-political ads by this advertiser)
 
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "ads_by_same_uploader": [
-                        {"youtube_video": yv}
-                        for yv in flatten(
-                            queries.search_observed_video_ads(
-                                session,
-                                uploader_id=uploader_id,
-                                start_date=start_date,
-                                end_date=end_date,
-                                missing_ads_only=True,
-                            )
-                            for uploader_id in queries.get_uploader_ids_for_advertiser(
-                                session, advertiser_name
-                            )
-                        )
-                    ]
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "ads_by_same_uploader": [
+                    {"youtube_video": yv}
+                    for yv in queries.search_observed_video_ads(
+                        session,
+                        uploader_ids=queries.get_uploader_ids_for_advertiser(
+                            session, advertiser_name
+                        ),
+                        start_date=start_date,
+                        end_date=end_date,
+                        missing_ads_only=True,
+                        page=page,
+                        page_size=page_size,
+                    )
+                ]
+            }
         )
 
 
@@ -231,7 +247,7 @@ def spend_of_advertiser(advertiser_name):
             end_date=end_date,
         )
 
-        return Response(json.dumps(spend), mimetype="application/json")
+        return _json_response(spend)
 
 
 @google_dashboard_blueprint.route("/advertiser/<advertiser_name>/spend_by_region")
@@ -253,7 +269,7 @@ def spend_of_advertiser_by_region(advertiser_name):
             end_date=end_date,
         )
 
-        return Response(json.dumps(spend_by_region), mimetype="application/json")
+        return _json_response(spend_by_region)
 
 
 @google_dashboard_blueprint.route("/search")
@@ -263,8 +279,7 @@ def spend_of_advertiser_by_region(advertiser_name):
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def search():
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     region = request.args.get(
         "region"
     )  # TODO: should this replace political_ads_in_state, political_ads_in_cbsa? (not implemented)
@@ -288,53 +303,47 @@ def search():
 
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
         if not videos_only:
-            return Response(
-                json.dumps(
-                    {
-                        "results": [
-                            {
-                                "google_ad_creative": google_ad_creative,
-                                "advertiser": google_ad_creative.advertiser,
-                                "creative_stat": google_ad_creative.creative_stat,
-                                "youtube_video": google_ad_creative.youtube_video,
-                            }
-                            for google_ad_creative in queries.search_political_ads(
-                                session,
-                                querystring=query,
-                                start_date=start_date,
-                                end_date=end_date,
-                                page=page,
-                                page_size=page_size,
-                                advertiser_name=advertiser_name,
-                            )
-                        ]
-                        # advertiser_id=None kwarg is available, but not settable via the search box (for now?)
-                    }
-                ),
-                mimetype="application/json",
+            return _json_response(
+                {
+                    "results": [
+                        {
+                            "google_ad_creative": google_ad_creative,
+                            "advertiser": google_ad_creative.advertiser,
+                            "creative_stat": google_ad_creative.creative_stat,
+                            "youtube_video": google_ad_creative.youtube_video,
+                        }
+                        for google_ad_creative in queries.search_political_ads(
+                            session,
+                            querystring=query,
+                            start_date=start_date,
+                            end_date=end_date,
+                            page=page,
+                            page_size=page_size,
+                            advertiser_name=advertiser_name,
+                        )
+                    ]
+                    # advertiser_id=None kwarg is available, but not settable via the search box (for now?)
+                }
             )
         else:
-            return Response(
-                json.dumps(
-                    {
-                        "results": [
-                            {"youtube_video": yv}
-                            for yv in queries.search_observed_video_ads(
-                                session,
-                                querystring=query,
-                                start_date=start_date,
-                                end_date=end_date,
-                                targeting={},
-                                observed_only=observed_videos_only,
-                                political_only=political_only,
-                                page=page,
-                                page_size=page_size,
-                            )
-                        ]
-                        # uploader_id=None kwarg is available, but not settable via the search box (for now?)
-                    }
-                ),
-                mimetype="application/json",
+            return _json_response(
+                {
+                    "results": [
+                        {"youtube_video": yv}
+                        for yv in queries.search_observed_video_ads(
+                            session,
+                            querystring=query,
+                            start_date=start_date,
+                            end_date=end_date,
+                            targeting={},
+                            observed_only=observed_videos_only,
+                            political_only=political_only,
+                            page=page,
+                            page_size=page_size,
+                        )
+                    ]
+                    # uploader_id=None kwarg is available, but not settable via the search box (for now?)
+                }
             )
 
 
@@ -345,19 +354,17 @@ def search():
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def autocomplete_advertiser_name():
-    advertiser_name_substr = request.args.get("advertiser_name_substr")
+    advertiser_name_substr = request.args.get("advertiser_name_substr", "")
     if len(advertiser_name_substr) <= 2:
-        return Response(json.dumps({"matches": []}), mimetype="application/json")
+        return _json_response({"matches": []})
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "matches": queries.autocomplete_advertiser_name(
-                        session, advertiser_name_substr
-                    )
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                # ILIKE is case insensitive, so lowercase to share memoized results across cases.
+                "matches": queries.autocomplete_advertiser_name(
+                    session, advertiser_name_substr.lower()
+                )
+            }
         )
 
 
@@ -379,8 +386,7 @@ def political_ads_in_cbsa():
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def all_missed_ads():
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     kind = request.args.get("kind")
     if kind and kind not in ["missed", "violative", "disappearing", "issue_advertiser"]:
         abort(400, "unknown kind of missed ad `{}`".format(kind))
@@ -388,19 +394,16 @@ def all_missed_ads():
     advertiser_substring = request.args.get("advertiser_substring")
 
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "result": queries.all_kinds_of_missed_ads(
-                        session,
-                        page=page,
-                        page_size=page_size,
-                        kind=kind,
-                        advertiser_substring=advertiser_substring,
-                    )
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "result": queries.all_kinds_of_missed_ads(
+                    session,
+                    page=page,
+                    page_size=page_size,
+                    kind=kind,
+                    advertiser_substring=advertiser_substring,
+                )
+            }
         )
 
 
@@ -411,30 +414,28 @@ def all_missed_ads():
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def missed_ads():
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "result": (
-                        {
-                            "youtube_video": yv,
-                            "political_value": [
-                                value.value
-                                for value in sorted(
-                                    yv.values, key=lambda val: val.model.created_at
-                                )
+        return _json_response(
+            {
+                "result": [
+                    {
+                        "youtube_video": yv,
+                        # value of the earliest politics model.
+                        "political_value": min(
+                            (
+                                value
+                                for value in yv.values
                                 if value.model.model_name == "politics"
-                            ][0],
-                        }
-                        for yv in queries.political_seeming_missed_ads(
-                            session, page=page, page_size=page_size
-                        )
+                            ),
+                            key=lambda val: val.model.created_at,
+                        ).value,
+                    }
+                    for yv in queries.political_seeming_missed_ads(
+                        session, page=page, page_size=page_size
                     )
-                }
-            ),
-            mimetype="application/json",
+                ]
+            }
         )
 
 
@@ -445,27 +446,23 @@ def missed_ads():
     timeout=date_utils.ONE_DAY_IN_SECONDS,
 )
 def disappeared_ads():
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     advertiser_name = request.args.get("advertiser_name", None)
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "disappeared_ads": [
-                        {
-                            "google_ad_creative": google_ad_creative,
-                            "advertiser": google_ad_creative.advertiser,
-                            "creative_stat": google_ad_creative.creative_stat,
-                            "youtube_video": google_ad_creative.youtube_video,
-                        }
-                        for google_ad_creative in queries.disappearing_ads(
-                            session, advertiser_name, page
-                        )
-                    ]
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "disappeared_ads": [
+                    {
+                        "google_ad_creative": google_ad_creative,
+                        "advertiser": google_ad_creative.advertiser,
+                        "creative_stat": google_ad_creative.creative_stat,
+                        "youtube_video": google_ad_creative.youtube_video,
+                    }
+                    for google_ad_creative in queries.disappearing_ads(
+                        session, advertiser_name, page
+                    )
+                ]
+            }
         )
 
 
@@ -478,23 +475,20 @@ def disappeared_ads():
 def disappeared_youtube_ads():
     # doesn't paginate for dumb reasons
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "disappeared_ads": [
-                        {
-                            "google_ad_creative": google_ad_creative,
-                            "advertiser": google_ad_creative.advertiser,
-                            "creative_stat": google_ad_creative.creative_stat,
-                            "youtube_video": google_ad_creative.youtube_video,
-                        }
-                        for google_ad_creative in queries.disappearing_youtube_ads(
-                            session
-                        )
-                    ]
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "disappeared_ads": [
+                    {
+                        "google_ad_creative": google_ad_creative,
+                        "advertiser": google_ad_creative.advertiser,
+                        "creative_stat": google_ad_creative.creative_stat,
+                        "youtube_video": google_ad_creative.youtube_video,
+                    }
+                    for google_ad_creative in queries.disappearing_youtube_ads(
+                        session
+                    )
+                ]
+            }
         )
 
 
@@ -506,20 +500,12 @@ def disappeared_youtube_ads():
 )
 def disappeared_ad_counts():
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "disappeared_ad_counts": [
-                        {
-                            "advertiser_name": item[0],
-                            "count": item[2],
-                            "min_spend": item[3],
-                        }
-                        for item in queries.disappearing_ads_counts(session)
-                    ]
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "disappeared_ad_counts": json_utils.raw_json(
+                    queries.disappearing_ads_counts(session)
+                )
+            }
         )
 
 
@@ -532,26 +518,22 @@ def disappeared_ad_counts():
 def violating_ads():
     # doesn't support paging because there are ~16 of these, so we should just do any pagination on the frontend.
     # TODO: support filtering to only the ones for which we have content to show
-    page = int(request.args.get("page", 1))
-    page_size = min(int(request.args.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    page, page_size = _page_and_page_size()
     with db_functions.get_google_ads_database_sqlalchemy_session() as session:
-        return Response(
-            json.dumps(
-                {
-                    "violating_ads": [
-                        {
-                            "google_ad_creative": google_ad_creative,
-                            "advertiser": google_ad_creative.advertiser,
-                            "creative_stat": google_ad_creative.creative_stat,
-                            "youtube_video": google_ad_creative.youtube_video,
-                        }
-                        for google_ad_creative in queries.violating_ads(
-                            session,
-                            page=page,
-                            page_size=page_size,
-                        )
-                    ]
-                }
-            ),
-            mimetype="application/json",
+        return _json_response(
+            {
+                "violating_ads": [
+                    {
+                        "google_ad_creative": google_ad_creative,
+                        "advertiser": google_ad_creative.advertiser,
+                        "creative_stat": google_ad_creative.creative_stat,
+                        "youtube_video": google_ad_creative.youtube_video,
+                    }
+                    for google_ad_creative in queries.violating_ads(
+                        session,
+                        page=page,
+                        page_size=page_size,
+                    )
+                ]
+            }
         )
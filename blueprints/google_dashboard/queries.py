@@ -571,6 +571,7 @@ def search_observed_video_ads(
     session,
     querystring=None,
     uploader_id=None,
+    uploader_ids=None,
     start_date=None,
     end_date=None,
     targeting=None,
@@ -584,6 +585,7 @@ def search_observed_video_ads(
     session: sqlalchemy session
     querystring: postgresql FTS plainto_tsquery search query.
     uploader_id: a YouTube user ID, like "Google" or "UCGdbbgHYS1Azgci6UH8xl3w"
+    uploader_ids: list of YouTube user IDs, to search videos of any of them in a single query.
     start_date: datetime.date or "YYYY-MM-DD"
     end_date: datetime.date or "YYYY-MM-DD"
     targeting: TODO
@@ -644,6 +646,8 @@ def search_observed_video_ads(
         )
     if uploader_id:
         query = query.filter(models.YoutubeVideo.uploader_id == uploader_id)
+    if uploader_ids is not None:
+        query = query.filter(models.YoutubeVideo.uploader_id.in_(uploader_ids))
     if start_date:
         query = query.filter(models.ObservedYoutubeAd.observedat >= start_date)
     if end_date:
@@ -655,6 +659,7 @@ def search_observed_video_ads(
     return list(query.slice((page - 1) * page_size, page * page_size))
 
 
+@caching.global_cache.memoize(timeout=ONE_DAY_IN_SECONDS, args_to_ignore=["session"])
 def autocomplete_advertiser_name(session, advertiser_name_substr):
     query = session.query(
         models.AdvertiserStat.advertiser_name, models.AdvertiserStat.advertiser_id
@@ -812,31 +817,46 @@ def disappearing_ads(session, advertiser_name=None, page=1, page_size=PAGE_SIZE)
     query = disappearing_ads_query(session)
     query = query.options(db.orm.joinedload(models.GoogleAdCreative.creative_stat))
     query = query.options(db.orm.joinedload(models.GoogleAdCreative.advertiser))
+    query = query.options(db.orm.joinedload(models.GoogleAdCreative.youtube_video))
     if advertiser_name:
         query = query.filter(models.AdvertiserStat.advertiser_name == advertiser_name)
     query = query.order_by(models.CreativeStat.report_date)
     return list(query.slice((page - 1) * page_size, page * page_size))
 
 
-def disappearing_ads_counts(session, page=1, page_size=PAGE_SIZE):
+def disappearing_ads_counts(session):
     """
     session: sqlalchemy session
-    page: 1-indexed
 
-    Count per advertiser of disappearing_ads()
+    Count per advertiser of disappearing_ads(), as JSON text of a list of
+    {"advertiser_name", "count", "min_spend"} objects (built by the DB, so rows aren't materialized
+    and re-serialized in python).
     """
     query = disappearing_ads_query(session)
     query = query.with_entities(
-        models.AdvertiserStat.advertiser_name,
+        models.AdvertiserStat.advertiser_name.label("advertiser_name"),
         models.YoutubeVideo.uploader,
-        db.func.count(),
-        db.func.sum(models.CreativeStat.spend_range_min_usd)
+        db.func.count().label("count"),
+        db.func.sum(models.CreativeStat.spend_range_min_usd).label("min_spend"),
     )
     query = query.group_by(
         models.AdvertiserStat.advertiser_name, models.YoutubeVideo.uploader
     )
-    query = query.order_by(db.func.sum(models.CreativeStat.spend_range_min_usd).desc())
-    return query.all()  # list(query.slice((page - 1) * page_size, page * page_size))
+    counts = query.subquery()
+    counts_json = db.func.json_agg(
+        postgresql.aggregate_order_by(
+            db.func.json_build_object(
+                "advertiser_name", counts.c.advertiser_name,
+                "count", counts.c.count,
+                "min_spend", counts.c.min_spend,
+            ),
+            counts.c.min_spend.desc(),
+        )
+    )
+    # cast to text so the driver doesn't decode the JSON.
+    return session.query(
+        db.cast(db.func.coalesce(counts_json, db.literal_column("'[]'::json")), db.Text)
+    ).scalar()
 
 
 def disappearing_youtube_ads(session):
@@ -887,9 +907,9 @@ def disappearing_youtube_ads(session):
         models.GoogleAdCreative.advertiser_id
     )  # not strictly necessary, but some wacky feature of Postgresql means that an unordered query with LIMIT 30 set takes ages and ages.
 
-    query = query.options(db.orm.subqueryload(models.GoogleAdCreative.youtube_video))
-    query = query.options(db.orm.subqueryload(models.GoogleAdCreative.creative_stat))
-    query = query.options(db.orm.subqueryload(models.GoogleAdCreative.advertiser))
+    query = query.options(db.orm.selectinload(models.GoogleAdCreative.youtube_video))
+    query = query.options(db.orm.selectinload(models.GoogleAdCreative.creative_stat))
+    query = query.options(db.orm.selectinload(models.GoogleAdCreative.advertiser))
     # from sqlalchemy.dialects import postgresql
     # print(query.statement.compile(dialect=postgresql.dialect()))
 
@@ -1035,8 +1055,8 @@ def violating_ads(session, page=1, page_size=PAGE_SIZE):
     """
     # returns GoogleAdCreative
     query = violating_ads_query(session)
-    query = query.options(db.orm.subqueryload(models.GoogleAdCreative.youtube_video))
-    query = query.options(db.orm.subqueryload(models.GoogleAdCreative.advertiser))
-    query = query.options(db.orm.subqueryload(models.GoogleAdCreative.creative_stat))
+    query = query.options(db.orm.selectinload(models.GoogleAdCreative.youtube_video))
+    query = query.options(db.orm.selectinload(models.GoogleAdCreative.advertiser))
+    query = query.options(db.orm.selectinload(models.GoogleAdCreative.creative_stat))
     query = query.order_by(models.GoogleAdCreative.policy_violation_date.desc())
     return list(query.slice((page - 1) * page_size, page * page_size))
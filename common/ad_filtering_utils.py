@@ -18,26 +18,25 @@ US_REGION_NAMES = [region['value'] for region in REGION_FILTERS_DATA if region['
 GENDER_FILTERS_DATA = load_json_from_path('genders.json')
 AGE_RANGE_FILTERS_DATA = load_json_from_path('ageRanges.json')
 AGE_RANGE_LABEL_TO_VALUE = {item['label']: item['value'] for item in AGE_RANGE_FILTERS_DATA}
+# Lowercased gender arg -> gender value to filter by (None for no filter).
+GENDER_ARG_TO_VALUE = {
+    'all': None,
+    'f': 'female', 'female': 'female',
+    'm': 'male', 'male': 'male',
+    'u': 'unknown', 'unknown': 'unknown'}
 ORDER_BY_FILTERS_DATA = load_json_from_path('orderBy.json')
 ORDER_DIRECTION_FILTERS_DATA = load_json_from_path('orderDirections.json')
 
-AD_SCREENSHOT_URL_TEMPLATE = (
-    'https://storage.googleapis.com/%(bucket_name)s/%(archive_id)s.png')
+AD_SCREENSHOT_URL_PREFIX_TEMPLATE = 'https://storage.googleapis.com/%s/'
 
 
 def parse_gender_value(gender):
     if gender is None:
         return None
-    gender = gender.lower()
-    if gender == 'all':
-        return None
-    if gender in ('f', 'female)'):
-        return 'female'
-    if gender in ('m', 'male'):
-        return 'male'
-    if gender in ('u', 'unknown'):
-        return 'unknown'
-    raise ValueError('Unknown gender value: %s' % gender)
+    try:
+        return GENDER_ARG_TO_VALUE[gender.lower()]
+    except KeyError:
+        raise ValueError('Unknown gender value: %s' % gender) from None
 
 def parse_age_range_value(age_range):
     if age_range is None:
@@ -68,6 +67,12 @@ def topic_names():
 def topics_filter_data():
     return [{'label': key, 'value': str(val)} for key, val in get_topic_id_to_name_map().items()]
 
-def make_ad_screenshot_url(archive_id):
-    return AD_SCREENSHOT_URL_TEMPLATE % {
-        'bucket_name': current_app.config['FB_AD_CREATIVE_GCS_BUCKET'], 'archive_id': archive_id}
+def ad_screenshot_url_prefix():
+    """Get URL prefix of ad screenshots. Callers making many screenshot URLs should get this once
+    and pass it to make_ad_screenshot_url."""
+    return AD_SCREENSHOT_URL_PREFIX_TEMPLATE % current_app.config['FB_AD_CREATIVE_GCS_BUCKET']
+
+def make_ad_screenshot_url(archive_id, url_prefix=None):
+    if url_prefix is None:
+        url_prefix = ad_screenshot_url_prefix()
+    return f'{url_prefix}{archive_id}.png'
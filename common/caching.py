@@ -6,18 +6,19 @@ config vars set).
 
 Exposes 2 endpoints to view cache keys, and clear cache.
 """
-import json
 import logging
 import os
 import contextlib
 import threading
 import functools
+import hashlib
+import inspect
 
-from flask import Blueprint, Response
+from flask import Blueprint, Response, request
 from flask_caching import Cache
 import redis.exceptions
 
-from common import date_utils, running_on_app_engine
+from common import date_utils, json_utils, running_on_app_engine
 
 global_cache = Cache()
 blueprint = Blueprint('caching', __name__)
@@ -41,6 +42,35 @@ def cache_if_response_no_server_error(resp):
         return True
     return resp.status_code >= 200 and resp.status_code < 500
 
+def make_response_conditional(resp):
+    """after_request handler which adds an ETag (hash of body) to successful GET responses, and
+    turns them into a bodiless 304 Not Modified if the request's If-None-Match matches it.
+
+    This lets clients that poll the same URLs skip transferring bodies they already have.
+    """
+    if request.method == 'GET' and resp.status_code == 200 and not resp.direct_passthrough:
+        if not resp.get_etag()[0]:
+            resp.add_etag()
+        resp.make_conditional(request)
+    return resp
+
+def cache_control_max_age(max_age):
+    """Decorator which marks successful responses of the decorated handler as cacheable by clients
+    and shared caches (ex: CDNs) for max_age seconds, so repeat requests need not reach the server.
+
+    Apply below @global_cache.cached so the header is stored with the cached response.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            resp = f(*args, **kwargs)
+            if resp.status_code == 200:
+                resp.cache_control.public = True
+                resp.cache_control.max_age = max_age
+            return resp
+        return decorated_function
+    return decorator
+
 def app_engine_service_cache_key_prefix():
     return '{}-{}-'.format(os.getenv('GOOGLE_CLOUD_PROJECT'), os.getenv('GAE_SERVICE'))
 
@@ -116,10 +146,13 @@ def cache_response_blocking_duplicate_generation_of_cache_payload(
                                                             response_filter=response_filter,
                                                             timeout=timeout)(f)
             cache_key = cached_function.make_cache_key(*args, **kwargs)
-            # if results in cache, call the cached function to get the cached result. Otherwise
-            # acquire lock so that only the lock holder executes the uncached logic.
-            if global_cache.get(cache_key):
-                return cached_function(*args, **kwargs)
+            # if results in cache, return the cached response (which holds the already serialized
+            # body) instead of calling the cached function, which would get it from the cache a
+            # second time. Otherwise acquire lock so that only the lock holder executes the
+            # uncached logic.
+            cached_response = global_cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
 
             with acquire_lock(cache_key):
                 return cached_function(*args, **kwargs)
@@ -154,6 +187,43 @@ def memoize_response_blocking_duplicate_generation_of_cache_payload(timeout):
         return decorated_function
     return decorator
 
+def memoize_by_args_digest(timeout):
+    """Memoize function results in global_cache, like flask-caching @memoize, keyed by a digest of
+    the function's argument values.
+
+    Argument values are put in the decorated function's parameter order (with defaults for omitted
+    args) once per call, and the key is a blake2b digest of their repr. This skips @memoize's per
+    call kwargs to args normalization and its extra cache read for the function's memoize version.
+    Arguments must have a stable repr (ex: str, int, datetime.date, None), and results can not be
+    cleared with delete_memoized.
+    """
+    def decorator(f):
+        parameters = tuple(inspect.signature(f).parameters.values())
+        key_prefix = 'memoize::{}.{}::'.format(f.__module__, f.__qualname__)
+
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            arg_values = args + tuple(kwargs.get(parameter.name, parameter.default)
+                                      for parameter in parameters[len(args):])
+            cache_key = key_prefix + hashlib.blake2b(repr(arg_values).encode(),
+                                                     digest_size=16).hexdigest()
+            try:
+                result = global_cache.get(cache_key)
+            except Exception:
+                logging.exception('Exception getting memoized result for %s', cache_key)
+                return f(*args, **kwargs)
+            if result is not None:
+                return result
+
+            result = f(*args, **kwargs)
+            try:
+                global_cache.set(cache_key, result, timeout=timeout)
+            except Exception:
+                logging.exception('Exception setting memoized result for %s', cache_key)
+            return result
+        return decorated_function
+    return decorator
+
 
 @blueprint.route('/cache/keys')
 def cache_list():
@@ -162,7 +232,7 @@ def cache_list():
     # TODO(macpd): fix occassional TypeError: Object of type bytes is not JSON serializable
     if has_redis_cache_env_vars():
         return Response(
-            json.dumps(
+            json_utils.dumps(
                 {'all-deployment-keys': list(map(str, global_cache.cache._read_clients.keys(
                     app_engine_deployment_cache_key_prefix() + '*'))),
                  'all-service-keys': list(map(str, global_cache.cache._read_clients.keys(
@@ -171,12 +241,13 @@ def cache_list():
             ),
             mimetype='application/json')
     return Response(
-        json.dumps(list(map(str, global_cache.cache._cache.keys()))), mimetype='application/json')
+        json_utils.dumps(list(map(str, global_cache.cache._cache.keys()))),
+        mimetype='application/json')
 
 @blueprint.route('/cache/clear')
 def cache_clear():
     # TODO(macpd): add authn and authz for this handler
-    return Response(json.dumps(global_cache.clear()))
+    return Response(json_utils.dumps(global_cache.clear()), mimetype='application/json')
 
 def init_cache(server, cache_blueprint_url_prefix):
     """Initialize cache (simple or redis backed depending on env), and register cache blueprint if
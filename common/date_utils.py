@@ -1,7 +1,8 @@
 import datetime
+import functools
 import logging
-import itertools
 
+import pandas as pd
 import simplejson as json
 
 SIX_HOURS_IN_SECONDS = int(datetime.timedelta(hours=6).total_seconds())
@@ -23,11 +24,20 @@ def parse_date_arg(arg_str, oldest_allowed_date=None, max_days_since_now=None):
         datetime.date of either parsed arg, oldest_allowed_date, or now - max_days_since_now.
         if arg cannot be parsed returns None.
     """
-    try:
-        parsed_date = datetime.datetime.strptime(arg_str, '%Y-%m-%d').date()
-    except ValueError as error:
-        logging.error('Unable to parse start_time arg. %s', error)
-        return None
+    parsed_date = None
+    # fromisoformat is much faster than strptime, but on python 3.11+ also accepts other ISO 8601
+    # formats (ie 20200623, 2020-W01-1), so only use it for zero padded %Y-%m-%d dates.
+    if len(arg_str) == 10 and arg_str[4] == arg_str[7] == '-':
+        try:
+            parsed_date = datetime.date.fromisoformat(arg_str)
+        except ValueError:
+            pass
+    if parsed_date is None:
+        try:
+            parsed_date = datetime.datetime.strptime(arg_str, '%Y-%m-%d').date()
+        except ValueError as error:
+            logging.error('Unable to parse start_time arg. %s', error)
+            return None
 
     if oldest_allowed_date and parsed_date < oldest_allowed_date:
         return oldest_allowed_date
@@ -60,10 +70,14 @@ def generate_time_periods(max_date, min_date, span_in_days=7):
         span_in_days: int number of days each span should be
     Returns:
         list of datetime.dates starting with max_date and all dates 7 days apart after that until
-        min_date.
+        min_date. Sorted in descending order, so weeks[0] is the latest date and weeks[-1] the
+        earliest.
     """
-    def date_n_days_ago(days):
-        return max_date - datetime.timedelta(days=days)
-    return list(
-        itertools.takewhile(
-            lambda x: x >= min_date, map(date_n_days_ago, range(0, 365, span_in_days))))
+    # Copy so callers can't mutate the memoized periods.
+    return list(_generate_time_periods(max_date, min_date, span_in_days))
+
+@functools.lru_cache(maxsize=1024)
+def _generate_time_periods(max_date, min_date, span_in_days):
+    num_periods = max((max_date - min_date).days // span_in_days + 1, 0)
+    time_periods = pd.date_range(end=max_date, periods=num_periods, freq=f'{span_in_days}D')
+    return tuple(time_periods.date[::-1])
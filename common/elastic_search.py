@@ -59,17 +59,27 @@ def query_elastic_search_fb_ad_creatives_index(elastic_search_api_params, ad_cre
     if max_results is not None:
         query['size'] = max_results
 
+    if return_archive_ids_only:
+        # Read archive_id from doc values instead of fetching and decompressing each hit's _source.
+        # track_total_hits is left as is, as elasticsearch does not allow disabling it for scroll
+        # searches.
+        query['_source'] = False
+        query['docvalue_fields'] = ['archive_id']
+        # Results are only used as a set of archive IDs, so relevance scores are never used. Match
+        # text in filter context so elasticsearch skips scoring (and can cache the clauses).
+        text_match_clauses = query_filter
+    else:
+        text_match_clauses = must
+
     if ad_creative_query is not None:
         sqs = {}
         sqs['simple_query_string'] = {}
         sqs['simple_query_string']['fields'] = [
             'body', 'link_url', 'link_title', 'link_description', 'link_caption', 'page_name',
             'funding_entity']
-        if return_archive_ids_only:
-            query['_source'] = ['archive_id']
         sqs['simple_query_string']['query'] = ad_creative_query
         sqs['simple_query_string']['default_operator'] = "and"
-        must.append(sqs)
+        text_match_clauses.append(sqs)
 
     if funding_entity_query is not None:
         sqs = {}
@@ -77,7 +87,7 @@ def query_elastic_search_fb_ad_creatives_index(elastic_search_api_params, ad_cre
         sqs['simple_query_string']['fields'] = ['funding_entity']
         sqs['simple_query_string']['query'] = funding_entity_query
         sqs['simple_query_string']['default_operator'] = "and"
-        must.append(sqs)
+        text_match_clauses.append(sqs)
 
     if page_id_query is not None:
         match = {}
@@ -108,7 +118,7 @@ def query_elastic_search_fb_ad_creatives_index(elastic_search_api_params, ad_cre
 
     data = {}
     if return_archive_ids_only:
-        data['data'] = list({hit['_source']['archive_id'] for hit in results})
+        data['data'] = list({hit['fields']['archive_id'][0] for hit in results})
     else:
         data['data'] = [hit['_source'] for hit in results]
 
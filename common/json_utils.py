@@ -0,0 +1,36 @@
+"""Helpers to serialize handler responses to JSON with orjson."""
+import decimal
+
+import orjson
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def _default(o):
+    """Serialize types orjson does not handle natively the same way simplejson did."""
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    # namedtuples are serialized as objects, like simplejson's namedtuple_as_object.
+    if hasattr(o, '_asdict'):
+        return o._asdict()
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError('Type is not JSON serializable: %s' % type(o).__name__)
+
+def raw_json(json_text):
+    """Wrap already serialized JSON (ex: built by a DB query) so that dumps() includes it as is,
+    instead of it being decoded to python objects and then serialized again."""
+    return orjson.Fragment(json_text)
+
+def dumps(obj, default=_default):
+    """Serialize obj to JSON.
+
+    datetime.date and datetime.datetime are serialized in ISO format, decimal.Decimal as float, and
+    namedtuples as objects (unless default overrides that).
+
+    Args:
+        obj: object to serialize.
+        default: callable to serialize types orjson does not handle natively.
+    Returns:
+        bytes of JSON encoded obj.
+    """
+    return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
@@ -2,11 +2,13 @@
 from collections import defaultdict, namedtuple
 import logging
 import os
+import threading
 from contextlib import contextmanager
 from typing import Text, Mapping, Optional
 
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from psycopg2 import sql
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
@@ -15,6 +17,8 @@ Session = sessionmaker()
 
 
 _DEFAULT_PAGE_SIZE = 250
+# Number of rows server side cursors fetch from the DB per round trip.
+_SERVER_SIDE_CURSOR_ITERSIZE = 2000
 
 AD_START_DATE_CLAUSE = sql.SQL(
     '(ad_delivery_start_time >= %(start_date)s OR last_active_date >= %(start_date)s)')
@@ -44,7 +48,17 @@ DatabaseConnectionParams = namedtuple('DatabaseConnectionParams',
                                        'sslkey',
                                        ])
 
-
+# gunicorn runs many request threads per worker process, so keep enough pooled connections for each
+# of them.
+FB_ADS_DATABASE_POOL_MIN_CONNECTIONS = int(
+    os.environ.get('FB_ADS_DATABASE_POOL_MIN_CONNECTIONS', 5))
+FB_ADS_DATABASE_POOL_MAX_CONNECTIONS = int(
+    os.environ.get('FB_ADS_DATABASE_POOL_MAX_CONNECTIONS', 50))
+_fb_ads_database_connection_pool = None
+_fb_ads_database_connection_pool_lock = threading.Lock()
+# psycopg2 pools raise PoolError when exhausted, so block on this instead.
+_fb_ads_database_connection_semaphore = threading.BoundedSemaphore(
+    FB_ADS_DATABASE_POOL_MAX_CONNECTIONS)
 
 def get_fb_ads_database_connection_params():
     return DatabaseConnectionParams(
@@ -58,22 +72,48 @@ def get_fb_ads_database_connection_params():
         sslcert=None,
         sslkey=None)
 
-def get_fb_ads_database_connection():
-    """Get connection to ad information database.
+def get_fb_ads_database_connection_pool():
+    """Get process wide pool of connections to ad information database, creating it if necessary.
 
     Returns:
-        psycopg2.connection ready to be used.
+        psycopg2.pool.ThreadedConnectionPool of connections to ad information database.
     """
-    return get_database_connection(get_fb_ads_database_connection_params())
+    global _fb_ads_database_connection_pool
+    with _fb_ads_database_connection_pool_lock:
+        if _fb_ads_database_connection_pool is None:
+            _fb_ads_database_connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                FB_ADS_DATABASE_POOL_MIN_CONNECTIONS, FB_ADS_DATABASE_POOL_MAX_CONNECTIONS,
+                get_database_connection_dsn(get_fb_ads_database_connection_params()))
+    return _fb_ads_database_connection_pool
 
-def get_database_connection(database_connection_params):
-    """Get pyscopg2 database connection using the provided params.
+@contextmanager
+def get_fb_ads_database_connection():
+    """Get connection to ad information database from a process wide connection pool.
+
+    Like using a psycopg2.connection as a context manager, the transaction is committed (or rolled
+    back if an exception is raised) on exit. The connection is then returned to the pool instead of
+    being left open. Blocks until a connection is available if all pooled connections are in use.
+
+    Yields:
+        psycopg2.connection ready to be used.
+    """
+    connection_pool = get_fb_ads_database_connection_pool()
+    with _fb_ads_database_connection_semaphore:
+        connection = connection_pool.getconn()
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection_pool.putconn(connection, close=bool(connection.closed))
+
+def get_database_connection_dsn(database_connection_params):
+    """Get pyscopg2 connection string for the provided params.
 
     Args:
         database_connection_params: DatabaseConnectionParams object from which to pull connection
         params.
     Returns:
-        psycopg2.connection ready to be used.
+        str libpq connection string.
     """
     db_authorize = ("host=%(host)s dbname=%(database_name)s user=%(username)s "
                     "password=%(password)s port=%(port)s") % database_connection_params._asdict()
@@ -85,7 +125,18 @@ def get_database_connection(database_connection_params):
         db_authorize += (
             " sslmode=verify-ca sslrootcert=%(sslrootcert)s sslcert=%(sslcert)s sslkey=%(sslkey)s"
             ) % database_connection_params._asdict()
-    connection = psycopg2.connect(db_authorize)
+    return db_authorize
+
+def get_database_connection(database_connection_params):
+    """Get pyscopg2 database connection using the provided params.
+
+    Args:
+        database_connection_params: DatabaseConnectionParams object from which to pull connection
+        params.
+    Returns:
+        psycopg2.connection ready to be used.
+    """
+    connection = psycopg2.connect(get_database_connection_dsn(database_connection_params))
     logging.debug('Established connecton to %s', connection.dsn)
     return connection
 
@@ -148,7 +199,13 @@ def get_page_aggregation_mode_table_name(table_name_template: Text, aggregate_by
                                                      **(additional_format_mappings or dict())))
 
 class BaseDBInterface():
-    """Base Database Interface implementation."""
+    """Base Database Interface implementation.
+
+    Interfaces are constructed per request around a pooled connection, so they only hold the
+    connection (in __slots__, to keep construction and attribute access cheap).
+    """
+    __slots__ = ('connection',)
+
     def __init__(self, connection):
         self.connection = connection
 
@@ -158,8 +215,23 @@ class BaseDBInterface():
 
         return self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
+    def get_server_side_cursor(self, name, real_dict_cursor=False):
+        """Get named (server side) cursor which fetches _SERVER_SIDE_CURSOR_ITERSIZE rows per round
+        trip when iterated, instead of buffering the entire result set client side.
+
+        Must be iterated before the transaction ends, and name must be unique in the transaction,
+        so callers should use it as a context manager.
+        """
+        cursor_factory = (psycopg2.extras.RealDictCursor if real_dict_cursor
+                          else psycopg2.extras.DictCursor)
+        cursor = self.connection.cursor(name=name, cursor_factory=cursor_factory)
+        cursor.itersize = _SERVER_SIDE_CURSOR_ITERSIZE
+        return cursor
+
 class UserDatabaseInterface(BaseDBInterface):
     """Interface to user database."""
+    __slots__ = ()
+
     def get_user(self, user_id):
         cursor = self.get_cursor()
         query = 'SELECT id, username, session_expires_at FROM users WHERE id = %s'
@@ -182,6 +254,7 @@ class UserDatabaseInterface(BaseDBInterface):
         return cursor.fetchone()
 
 class AdScreenerDBInterface(UserDatabaseInterface):
+    __slots__ = ()
 
     def is_this_ad_problematic_label_name_to_id(self):
         cursor = self.get_cursor()
@@ -339,6 +412,8 @@ class AdScreenerDBInterface(UserDatabaseInterface):
 
 class FBAdsDBInterface(BaseDBInterface):
     """Interface to Ads Info database."""
+    __slots__ = ()
+
 
     def get_page_data(self, page_id):
         cursor = self.get_cursor()
@@ -374,17 +449,21 @@ class FBAdsDBInterface(BaseDBInterface):
         return None
 
     def topics(self):
-        cursor = self.get_cursor()
+        """Get dict topic_name -> topic_id."""
+        # Plain tuple cursor since rows are only used as key, value pairs.
+        cursor = self.connection.cursor()
         query = 'SELECT topic_name, topic_id FROM topics ORDER BY topic_name'
         cursor.execute(query)
         logging.debug('topics query: %s', cursor.query.decode())
-        return {row['topic_name']: row['topic_id'] for row in cursor.fetchall()}
+        return dict(cursor.fetchall())
 
     def topic_id_to_name_map(self):
-        cursor = self.get_cursor()
-        query = 'SELECT topic_name, topic_id FROM topics ORDER BY topic_name'
+        """Get dict topic_id -> topic_name."""
+        # Plain tuple cursor since rows are only used as key, value pairs.
+        cursor = self.connection.cursor()
+        query = 'SELECT topic_id, topic_name FROM topics ORDER BY topic_name'
         cursor.execute(query)
-        return {row['topic_id']: row['topic_name'] for row in cursor.fetchall()}
+        return dict(cursor.fetchall())
 
     def cluster_languages(self):
         cursor = self.get_cursor()
@@ -989,90 +1068,60 @@ class FBAdsDBInterface(BaseDBInterface):
         logging.debug('ad_cluster_details_for_page_id query: %s', cursor.query.decode())
         return cursor.fetchall()
 
-    def ad_cluster_region_impression_results(self, ad_cluster_id):
-        cursor = self.get_cursor(real_dict_cursor=True)
-        query = (
-            'SELECT ad_cluster_id, region, min_spend_sum, max_spend_sum, min_impressions_sum, '
-            'max_impressions_sum FROM ad_cluster_region_impression_results WHERE ad_cluster_id = '
-            '%(ad_cluster_id)s')
-        cursor.execute(query, {'ad_cluster_id': ad_cluster_id})
-        return cursor.fetchall()
+    def ad_cluster_details(self, ad_cluster_id):
+        """Get all data shown on ad cluster details page in a single query.
 
-    def ad_cluster_demo_impression_results(self, ad_cluster_id):
+        Returns:
+            dict of ad_cluster_metadata columns, plus region_impression_results and
+            demo_impression_results JSON array strings (with min/max spend and impressions keys
+            named like ad_details's, ie without _sum), advertiser_info list of dicts,
+            funding_entities, archive_ids, languages and currencies lists, and topics (None if no
+            topics), ad_types and recognized_entities comma separated strings. None if
+            ad_cluster_id does not exist.
+        """
         cursor = self.get_cursor(real_dict_cursor=True)
-        query = (
-            'SELECT ad_cluster_id, age_group, gender, min_spend_sum, max_spend_sum, '
-            'min_impressions_sum, max_impressions_sum FROM ad_cluster_demo_impression_results '
-            'WHERE ad_cluster_id = %(ad_cluster_id)s')
+        query = '''
+            SELECT ad_cluster_metadata.*,
+            (SELECT COALESCE(json_agg(region_results), '[]') FROM (
+                SELECT region, min_spend_sum AS min_spend, max_spend_sum AS max_spend,
+                min_impressions_sum AS min_impressions, max_impressions_sum AS max_impressions
+                FROM ad_cluster_region_impression_results
+                WHERE ad_cluster_id = %(ad_cluster_id)s) AS region_results
+            )::text AS region_impression_results,
+            (SELECT COALESCE(json_agg(demo_results), '[]') FROM (
+                SELECT age_group, gender, min_spend_sum AS min_spend, max_spend_sum AS max_spend,
+                min_impressions_sum AS min_impressions, max_impressions_sum AS max_impressions
+                FROM ad_cluster_demo_impression_results
+                WHERE ad_cluster_id = %(ad_cluster_id)s) AS demo_results
+            )::text AS demo_impression_results,
+            (SELECT COALESCE(json_agg(advertisers ORDER BY page_url, page_type, fec_id, party,
+                                      partisan_lean, advertiser_score DESC), '[]') FROM (
+                SELECT DISTINCT advertiser_score, partisan_lean, party, fec_id, page_url,
+                page_type, page_id, page_name FROM pages
+                JOIN page_metadata USING(page_id) JOIN ad_cluster_pages USING(page_id)
+                WHERE ad_cluster_id = %(ad_cluster_id)s) AS advertisers
+            ) AS advertiser_info,
+            (SELECT string_agg(DISTINCT topic_name, ', ') FROM topics
+             JOIN ad_cluster_topics USING(topic_id)
+             WHERE ad_cluster_id = %(ad_cluster_id)s) AS topics,
+            ARRAY(SELECT DISTINCT funding_entity FROM ad_clusters JOIN ads USING(archive_id)
+                  WHERE ad_cluster_id = %(ad_cluster_id)s) AS funding_entities,
+            ARRAY(SELECT archive_id FROM ad_clusters
+                  WHERE ad_cluster_id = %(ad_cluster_id)s) AS archive_ids,
+            (SELECT COALESCE(string_agg(ad_type, ', '), '') FROM ad_cluster_types
+             WHERE ad_cluster_id = %(ad_cluster_id)s) AS ad_types,
+            (SELECT COALESCE(string_agg(entity_name, ', '), '') FROM ad_cluster_recognized_entities
+             JOIN recognized_entities USING(entity_id)
+             WHERE ad_cluster_id = %(ad_cluster_id)s) AS recognized_entities,
+            ARRAY(SELECT DISTINCT language FROM ad_cluster_languages
+                  WHERE ad_cluster_id = %(ad_cluster_id)s AND language IS NOT NULL) AS languages,
+            ARRAY(SELECT DISTINCT currency FROM ad_cluster_currencies
+                  WHERE ad_cluster_id = %(ad_cluster_id)s AND currency IS NOT NULL) AS currencies
+            FROM ad_cluster_metadata WHERE ad_cluster_id = %(ad_cluster_id)s'''
         cursor.execute(query, {'ad_cluster_id': ad_cluster_id})
-        return cursor.fetchall()
-
-    def ad_cluster_archive_ids(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = 'SELECT archive_id FROM ad_clusters WHERE ad_cluster_id = %s'
-        cursor.execute(query, (ad_cluster_id, ))
-        return [row['archive_id'] for row in cursor.fetchall()]
-
-    def ad_cluster_metadata(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = 'SELECT * FROM ad_cluster_metadata WHERE ad_cluster_id = %s'
-        cursor.execute(query, (ad_cluster_id, ))
+        logging.debug('ad_cluster_details query: %s', cursor.query.decode())
         return cursor.fetchone()
 
-    def ad_cluster_types(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = 'SELECT ad_type FROM ad_cluster_types WHERE ad_cluster_id = %s'
-        cursor.execute(query, (ad_cluster_id, ))
-        return [row['ad_type'] for row in cursor.fetchall()]
-
-    def ad_cluster_recognized_entities(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT entity_name FROM ad_cluster_recognized_entities JOIN recognized_entities '
-            'USING(entity_id) WHERE ad_cluster_id = %s')
-        cursor.execute(query, (ad_cluster_id, ))
-        return [row['entity_name'] for row in cursor.fetchall()]
-
-    def ad_cluster_advertiser_info(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT DISTINCT advertiser_score, partisan_lean, party, fec_id, page_url, page_type, '
-            'page_id, page_name FROM pages JOIN page_metadata USING(page_id) JOIN ad_cluster_pages '
-            'USING(page_id) WHERE ad_cluster_id = %s ORDER BY page_url, page_type, fec_id, party, '
-            'partisan_lean, advertiser_score DESC')
-        cursor.execute(query, (ad_cluster_id, ))
-        return cursor.fetchall()
-
-    def ad_cluster_topics(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT DISTINCT topic_name FROM topics JOIN ad_cluster_topics USING(topic_id) '
-            'WHERE ad_cluster_id = %s')
-        cursor.execute(query, (ad_cluster_id, ))
-        return [row['topic_name'] for row in cursor.fetchall()]
-
-    def ad_cluster_funder_names(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT funding_entity FROM ad_clusters JOIN ads USING(archive_id) '
-            'WHERE ad_cluster_id = %(ad_cluster_id)s')
-        cursor.execute(query, {'ad_cluster_id': ad_cluster_id})
-        return {r['funding_entity'] for r in cursor.fetchall()}
-
-    def ad_cluster_languages(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = ('SELECT DISTINCT language FROM ad_cluster_languages WHERE ad_cluster_id = '
-                 '%(ad_cluster_id)s AND language IS NOT NULL')
-        cursor.execute(query, {'ad_cluster_id': ad_cluster_id})
-        return [r['language'] for r in cursor]
-
-    def ad_cluster_currencies(self, ad_cluster_id):
-        cursor = self.get_cursor()
-        query = ('SELECT DISTINCT currency FROM ad_cluster_currencies WHERE ad_cluster_id = '
-                 '%(ad_cluster_id)s AND currency IS NOT NULL')
-        cursor.execute(query, {'ad_cluster_id': ad_cluster_id})
-        return [r['currency'] for r in cursor]
-
     def get_cluster_id_from_archive_id(self, archive_id):
         cursor = self.get_cursor()
         query = 'SELECT ad_cluster_id FROM ad_clusters WHERE archive_id = %s'
@@ -1082,79 +1131,57 @@ class FBAdsDBInterface(BaseDBInterface):
             return None
         return result['ad_cluster_id']
 
-    def ad_region_impression_results(self, archive_id):
-        cursor = self.get_cursor(real_dict_cursor=True)
-        query = (
-            'SELECT archive_id, region, min_spend, max_spend, min_impressions, max_impressions '
-            'FROM region_impression_results WHERE archive_id = %(archive_id)s')
-        cursor.execute(query, {'archive_id': archive_id})
-        return cursor.fetchall()
+    def ad_details(self, archive_id):
+        """Get all data shown on ad details page in a single query.
 
-    def ad_demo_impression_results(self, archive_id):
+        Returns:
+            dict of currency, ad_delivery_start_time, last_active_date, spend and impressions,
+            plus region_impression_results and demo_impression_results JSON array strings,
+            advertiser_info list of dicts, funding_entities and languages lists, and topics (None
+            if no topics), ad_types and recognized_entities comma separated strings. None if
+            archive_id does not exist.
+        """
         cursor = self.get_cursor(real_dict_cursor=True)
-        query = (
-            'SELECT archive_id, age_group, gender, min_spend, max_spend, min_impressions, '
-            'max_impressions FROM demo_impression_results WHERE archive_id = %(archive_id)s')
+        query = '''
+            SELECT archive_id, currency, ad_delivery_start_time,
+            COALESCE(last_active_date, ad_delivery_stop_time) AS last_active_date,
+            min_spend, max_spend, min_impressions, max_impressions,
+            (SELECT COALESCE(json_agg(region_results), '[]') FROM (
+                SELECT region, min_spend, max_spend, min_impressions, max_impressions
+                FROM region_impression_results
+                WHERE archive_id = %(archive_id)s) AS region_results
+            )::text AS region_impression_results,
+            (SELECT COALESCE(json_agg(demo_results), '[]') FROM (
+                SELECT age_group, gender, min_spend, max_spend, min_impressions, max_impressions
+                FROM demo_impression_results
+                WHERE archive_id = %(archive_id)s) AS demo_results
+            )::text AS demo_impression_results,
+            (SELECT COALESCE(json_agg(advertisers ORDER BY page_url, page_type, fec_id, party,
+                                      partisan_lean, advertiser_score DESC), '[]') FROM (
+                SELECT DISTINCT advertiser_score, partisan_lean, party, fec_id, page_url,
+                page_type, page_id, page_name FROM pages
+                JOIN page_metadata USING(page_id) JOIN ads USING(page_id)
+                WHERE archive_id = %(archive_id)s) AS advertisers
+            ) AS advertiser_info,
+            (SELECT string_agg(DISTINCT topic_name, ', ') FROM topics JOIN ad_topics USING(topic_id)
+             WHERE archive_id = %(archive_id)s) AS topics,
+            ARRAY(SELECT DISTINCT funding_entity FROM ads
+                  WHERE archive_id = %(archive_id)s) AS funding_entities,
+            (SELECT COALESCE(string_agg(ad_type, ', '), '') FROM ad_metadata
+             WHERE archive_id = %(archive_id)s) AS ad_types,
+            (SELECT COALESCE(string_agg(entity_name, ', '), '')
+             FROM ad_creative_to_recognized_entities JOIN recognized_entities USING(entity_id)
+             JOIN ad_creatives USING(ad_creative_id)
+             WHERE archive_id = %(archive_id)s) AS recognized_entities,
+            ARRAY(SELECT DISTINCT ad_creative_body_language FROM ad_creatives
+                  WHERE archive_id = %(archive_id)s AND ad_creative_body_language IS NOT NULL
+            ) AS languages
+            FROM ads JOIN impressions USING(archive_id) WHERE archive_id = %(archive_id)s
+            LIMIT 1'''
         cursor.execute(query, {'archive_id': archive_id})
-        return cursor.fetchall()
-
-    def ad_timing_and_impressions_data(self, archive_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT archive_id, currency, funding_entity, ad_delivery_start_time, '
-            'COALESCE(last_active_date, ad_delivery_stop_time) AS last_active_date, '
-            'min_spend, max_spend, min_impressions, max_impressions '
-            'FROM ads JOIN impressions  USING(archive_id) WHERE archive_id = %s')
-        cursor.execute(query, (archive_id, ))
-        logging.debug('ad_timing_and_impressions_data query: %s', cursor.query.decode())
+        logging.debug('ad_details query: %s', cursor.query.decode())
         return cursor.fetchone()
 
-    def ad_types(self, archive_id):
-        cursor = self.get_cursor()
-        query = 'SELECT ad_type FROM ad_metadata WHERE archive_id = %s'
-        cursor.execute(query, (archive_id, ))
-        return [row['ad_type'] for row in cursor.fetchall()]
-
-    def ad_recognized_entities(self, archive_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT entity_name FROM ad_creative_to_recognized_entities JOIN recognized_entities '
-            'USING(entity_id) JOIN ad_creatives USING(ad_creative_id) WHERE archive_id = %s')
-        cursor.execute(query, (archive_id, ))
-        return [row['entity_name'] for row in cursor.fetchall()]
-
-    def ad_advertiser_info(self, archive_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT DISTINCT advertiser_score, partisan_lean, party, fec_id, page_url, page_type, '
-            'page_id, page_name FROM pages JOIN page_metadata USING(page_id) JOIN ads '
-            'USING(page_id) WHERE archive_id = %s ORDER BY page_url, page_type, fec_id, party, '
-            'partisan_lean, advertiser_score DESC')
-        cursor.execute(query, (archive_id, ))
-        return cursor.fetchall()
-
-    def ad_topics(self, archive_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT DISTINCT topic_name FROM topics JOIN ad_topics USING(topic_id) '
-            'WHERE archive_id = %s')
-        cursor.execute(query, (archive_id, ))
-        return [row['topic_name'] for row in cursor.fetchall()]
-
-    def ad_funder_names(self, archive_id):
-        cursor = self.get_cursor()
-        query = (
-            'SELECT funding_entity FROM ads WHERE archive_id = %(archive_id)s')
-        cursor.execute(query, {'archive_id': archive_id})
-        return {r['funding_entity'] for r in cursor.fetchall()}
-
-    def ad_languages(self, archive_id):
-        cursor = self.get_cursor()
-        query = ('SELECT DISTINCT ad_creative_body_language FROM ad_creatives WHERE archive_id = '
-                 '%(archive_id)s AND ad_creative_body_language IS NOT NULL')
-        cursor.execute(query, {'archive_id': archive_id})
-        return [r['ad_creative_body_language'] for r in cursor]
-
     def get_existent_archive_ids(self, archive_ids):
         cursor = self.get_cursor()
         query = ('SELECT array_agg(DISTINCT archive_id) archive_ids from ads where archive_id = ANY(%(archive_id)s)')
@@ -1163,20 +1190,22 @@ class FBAdsDBInterface(BaseDBInterface):
         return result
 
     def all_ad_creative_image_simhashes(self):
-        """Returns Dict image_sim_hash -> set of archive_ids.x
+        """Returns Dict image_sim_hash -> lowest archive_id with that image_sim_hash.
         """
-        cursor = self.get_cursor()
         simhash_query = (
-            'SELECT DISTINCT archive_id, image_sim_hash FROM ad_creatives WHERE image_sim_hash '
-            'IS NOT NULL AND image_sim_hash != \'\' '
+            'SELECT image_sim_hash, MIN(archive_id) FROM ad_creatives WHERE image_sim_hash '
+            'IS NOT NULL AND image_sim_hash != \'\' GROUP BY image_sim_hash'
         )
-        cursor.execute(simhash_query)
-        logging.debug('all_ad_creative_image_simhashes query: %s', cursor.query.decode())
-        # Put all query results in dict of image_sim_hash -> set of archive_ids
-        sim_hash_to_archive_id_set = defaultdict(set)
-        for row in cursor:
-            sim_hash_to_archive_id_set[int(row['image_sim_hash'], 16)].add(row['archive_id'])
-        return sim_hash_to_archive_id_set
+        with self.get_server_side_cursor('all_ad_creative_image_simhashes') as cursor:
+            cursor.execute(simhash_query)
+            logging.debug('all_ad_creative_image_simhashes query: %s', cursor.query.decode())
+            sim_hash_to_archive_id = {}
+            for hex_sim_hash, archive_id in cursor:
+                # Differently formatted hex strings (ex: with leading zeros) can be the same simhash.
+                sim_hash = int(hex_sim_hash, 16)
+                sim_hash_to_archive_id[sim_hash] = min(
+                    archive_id, sim_hash_to_archive_id.get(sim_hash, archive_id))
+        return sim_hash_to_archive_id
 
     def get_similar_ads_by_simhash(self, archive_id, feature, bit_difference):
         cursor = self.get_cursor()
@@ -1545,10 +1574,11 @@ class FBAdsDBInterface(BaseDBInterface):
                     'total_spend_by_{page_aggregation_mode}_of_topic_in_all_regions', aggregate_by)
             query = sql.SQL(
                 'select COALESCE(sum(spend_estimate), sum(midpoint_spend)) as spend, '
-                'ad_delivery_start_time, last_active_date, page_id, page_name '
+                'ad_delivery_start_time, last_active_date, page_id, '
+                'min(min(page_name)) OVER (PARTITION BY page_id) AS page_name '
                 'FROM {table_name} '
                 'where topic_id = %(topic_id)s and {ad_start_and_end_date_clause} '
-                'group by page_id,page_name,ad_delivery_start_time,last_active_date')
+                'group by page_id,ad_delivery_start_time,last_active_date')
             query_args = {'topic_id': topic_id, 'start_date': start_date, 'end_date': end_date}
         else:
             table_name = get_page_aggregation_mode_table_name(
@@ -1556,11 +1586,12 @@ class FBAdsDBInterface(BaseDBInterface):
             query = sql.SQL(
                 'select COALESCE(sum(region_impression_results_spend_estimate), '
                 '                sum(region_impression_results_midpoint_spend)) as spend, '
-                'ad_delivery_start_time, last_active_date, page_id, page_name '
+                'ad_delivery_start_time, last_active_date, page_id, '
+                'min(min(page_name)) OVER (PARTITION BY page_id) AS page_name '
                 'FROM {table_name} '
                 'where region = %(region_name)s and {ad_start_and_end_date_clause} '
                 'AND topic_id = %(topic_id)s '
-                'group by page_id,page_name,ad_delivery_start_time,last_active_date')
+                'group by page_id,ad_delivery_start_time,last_active_date')
             query_args = {'region_name': region_name, 'topic_id': topic_id,
                           'start_date': start_date, 'end_date': end_date}
         cursor.execute(
@@ -1888,16 +1919,20 @@ class FBAdsDBInterface(BaseDBInterface):
         return result
 
     def race_pages(self):
-        cursor = self.get_cursor(True)
+        """Get dict race_id -> list of page_ids in race."""
+        # Plain tuple cursor since rows are only used as key, value pairs.
+        cursor = self.connection.cursor()
         query = ('SELECT race_id, array_agg(page_id) AS page_ids FROM race_pages JOIN '
                  'races_total_spend_estimate_more_than_2k_since_2020_07_01 USING(race_id) GROUP BY '
                  'race_id ORDER BY race_id')
         cursor.execute(query)
         logging.debug('race_pages query: %s', cursor.query.decode())
-        return cursor.fetchall()
+        return dict(cursor.fetchall())
 
     def state_races(self):
-        cursor = self.get_cursor()
+        """Get dict state -> list of race_ids in state (contains None if state has no races)."""
+        # Plain tuple cursor since rows are only used as key, value pairs.
+        cursor = self.connection.cursor()
         query = ('''
                  SELECT region_populations.region AS state,
                  array_agg(DISTINCT
@@ -1909,7 +1944,7 @@ class FBAdsDBInterface(BaseDBInterface):
                  ORDER BY region_populations.region;''')
         cursor.execute(query)
         logging.debug('state_races query: %s', cursor.query.decode())
-        return cursor.fetchall()
+        return dict(cursor.fetchall())
 
     def candidates_in_race(self, race_id):
         cursor = self.get_cursor(True)
@@ -1934,6 +1969,28 @@ class FBAdsDBInterface(BaseDBInterface):
         logging.debug('owned_page_info query: %s', cursor.query.decode())
         return results
 
+    def owned_page_info_of_page_owners(self, page_owners):
+        """Get info of pages owned by each of page_owners in a single query.
+
+        Args:
+            page_owners: list of int page owner IDs.
+        Returns:
+            dict page_owner -> list of dicts with page_name, page_id, and disclaimers of pages owned
+            by page_owner.
+        """
+        cursor = self.get_cursor(True)
+        query = (
+            '''SELECT page_owner, page_name, page_id, disclaimers FROM owned_page_info
+            WHERE page_owner = ANY(%(page_owners)s)''')
+        cursor.execute(query, {'page_owners': page_owners})
+        logging.debug('owned_page_info_of_page_owners query: %s', cursor.query.decode())
+        owned_page_info = defaultdict(list)
+        for row in cursor:
+            owned_page_info[row['page_owner']].append(
+                {'page_name': row['page_name'], 'page_id': row['page_id'],
+                 'disclaimers': row['disclaimers']})
+        return owned_page_info
+
     def page_owner_page_name(self, page_id):
         cursor = self.get_cursor(True)
         query = (
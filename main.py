@@ -72,10 +72,15 @@ def init_server():
     server.config['REMEMBER_COOKIE_SECURE'] = True
     server.secret_key = os.environb[b'FLASK_APP_SECRET_KEY']
 
+    # The client is shared by all request threads, and keeps this many keep-alive connections per
+    # node so concurrent searches reuse connections instead of opening new TLS connections.
+    elastic_search_connections_per_node = int(
+        os.environ.get('FB_ADS_ELASTIC_SEARCH_CONNECTIONS_PER_NODE', 50))
     server.config['FB_ADS_ELASTIC_SEARCH_API_PARAMS'] = ElasticSearchApiParams(
         client=Elasticsearch(cloud_id=os.environ['FB_ADS_ELASTIC_SEARCH_CLOUD_ID'],
                              api_key=(os.environ['FB_ADS_ELASTIC_SEARCH_API_ID'],
-                                      os.environ['FB_ADS_ELASTIC_SEARCH_API_KEY'])),
+                                      os.environ['FB_ADS_ELASTIC_SEARCH_API_KEY']),
+                             connections_per_node=elastic_search_connections_per_node),
         api_id=os.environ['FB_ADS_ELASTIC_SEARCH_API_ID'],
         api_key=os.environ['FB_ADS_ELASTIC_SEARCH_API_KEY'],
         fb_pages_index_name=os.environ['FB_ADS_ELASTIC_SEARCH_FB_PAGES_INDEX_NAME'],